@@ -0,0 +1,401 @@
+"""
+File:    benchmark.py
+Purpose: Measure the speed and accuracy of the cryptogram solver.
+
+Usage:   python benchmark.py --output results.json
+         python benchmark.py --baseline results.json
+
+Solves the sample cryptograms plus a reproducible (seeded) set of generated
+ones and reports latency percentiles, prune and hint run counts, memory use
+and how many letters were decrypted correctly.  Results can be saved as JSON and later
+runs compared against them to catch regressions; a baseline run with other
+settings (count, seed, samples or engine) is refused.
+"""
+import argparse
+import json
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+import cryptogram
+
+# Known answers to cryptogram._SAMPLE_GRAMS (same order).
+_SAMPLE_ANSWERS = ["Contemptuous lights flashed across the computer's console. "
+                   + "- Hitchhiker's Guide to the Galaxy",
+                   "The whole problem with the world is that fools and fanatics "
+                   + "are always so certain of themselves, but wiser people so full "
+                   + "of doubts. - Bertrand Russell",
+                   "Four score and seven years ago our fathers brought forth on this "
+                   + "continent, a new nation, conceived in Liberty, and dedicated to "
+                   + "the proposition that all men are created equal.",
+                   "A banker is a fellow who lends you his umbrella when the sun is "
+                   + "shining and wants it back the minute it begins to rain.- Mark Twain",
+                   "A serious and good philosophical work could be written consisting "
+                   + "entirely of jokes.",
+                   "For the wages of sin is death, but the gift of God is eternal life "
+                   + "in Christ Jesus our Lord",
+                   "I think crime pays. The hours are good, you meet a lot of "
+                   + "interesting people, you travel a lot.",
+                   "The gambling known as business looks with austere disfavor upon "
+                   + "the business known as gambling.",
+                   "He answered and said, Whether he be a sinner or no, I know not: one "
+                   + "thing I know, that, whereas I was blind, now I see.",
+                   "If you try and take a cat apart to see how it works, the first thing "
+                   + "you have on your hands is a nonworking cat",
+                   "Programs must be written for people to read, and only incidentally "
+                   + "for machines to execute.",
+                   "Any sufficiently advanced technology is indistinguishable from magic.",
+                   ]
+
+# Plain texts the generated cryptograms are made from.
+_PLAIN_TEXTS = ["The quick brown fox jumps over the lazy dog.",
+                "It was the best of times, it was the worst of times.",
+                "All that glitters is not gold.",
+                "A journey of a thousand miles begins with a single step.",
+                "The only thing we have to fear is fear itself.",
+                "Ask not what your country can do for you, ask what you can do for "
+                + "your country.",
+                "In the middle of difficulty lies opportunity.",
+                "Knowledge is power, and power is the right to act.",
+                "The early bird catches the worm, but the second mouse gets the cheese.",
+                "Those who cannot remember the past are condemned to repeat it.",
+                "Not everything that can be counted counts, and not everything that "
+                + "counts can be counted.",
+                "Life is what happens to you while you are busy making other plans.",
+                "The secret of getting ahead is getting started.",
+                "We are what we repeatedly do. Excellence, then, is not an act, but "
+                + "a habit.",
+                "Simplicity is the ultimate sophistication.",
+                "Whatever you are, be a good one.",
+                "Well done is better than well said.",
+                "The pen is mightier than the sword.",
+                "Time is money, but money is not time.",
+                "Nothing in life is to be feared, it is only to be understood.",
+                ]
+
+# Generated cryptograms use this many plain texts joined together, so the
+# corpus covers short, medium and long cryptograms.
+_TEXTS_PER_GRAM = [1, 1, 2, 3, 5]
+
+_DEFAULT_COUNT = 20
+_DEFAULT_SEED = 2023
+# A run is a regression if its latency grows by more than this fraction of
+# the baseline's ...
+_DEFAULT_TOLERANCE = 0.2
+# ... or its accuracy drops by more than this much.
+_ACCURACY_TOLERANCE = 0.01
+# Settings a baseline must have been run with to be compared against, the
+# ones that change which cryptograms are solved and how
+_COMPARED_SETTINGS = ("count", "seed", "samples", "engine")
+
+
+def generated_grams(count: int, seed: int) -> list:
+    """
+    Create a reproducible set of cryptograms from _PLAIN_TEXTS.
+
+    param count: number of cryptograms to create
+    param seed: random seed, the same seed always gives the same cryptograms
+    return: list of (name, cryptogram, plain text) tuples
+    """
+    rng = random.Random(seed)
+    saved_state = random.getstate()
+    grams = []
+
+    try:
+        # create_cryptogram draws its key from the random module
+        random.seed(seed)
+        for idx in range(count):
+            texts = rng.sample(_PLAIN_TEXTS, _TEXTS_PER_GRAM[idx % len(_TEXTS_PER_GRAM)])
+            plain = ' '.join(texts)
+            grams.append((f"generated-{idx}", cryptogram.create_cryptogram(plain), plain))
+    finally:
+        random.setstate(saved_state)
+
+    return grams
+
+
+def answer_tokens(answer: str) -> list:
+    """
+    Split a solution into one item per character of the cryptogram.  A
+    bracketed set of options, such as [fmbq] or [6], is one item.
+
+    param answer: solution returned by the solver
+    return: list of strings
+    """
+    tokens = []
+    idx = 0
+    while idx < len(answer):
+        if '[' == answer[idx] and ']' in answer[idx:]:
+            end = answer.index(']', idx)
+            tokens.append(answer[idx:end + 1])
+            idx = end + 1
+        else:
+            tokens.append(answer[idx])
+            idx += 1
+    return tokens
+
+
+def letter_accuracy(answer: str, plain: str) -> float:
+    """
+    Find the fraction of letters solved correctly.  Letters left with
+    several options count as wrong.
+
+    param answer: solution returned by the solver
+    param plain: the correct plain text
+    return: number from 0.0 to 1.0
+    """
+    letters = [ltr.lower() for ltr in plain if ltr.lower() in string.ascii_lowercase]
+    if not letters:
+        return 1.0
+
+    solved = [tkn.lower() for tkn in answer_tokens(answer)
+              if tkn.lower() in string.ascii_lowercase or tkn.startswith('[') or '*' == tkn]
+    correct = sum(1 for want, got in zip(letters, solved) if want == got)
+    return correct / len(letters)
+
+
+def percentile(values: list, pct: float) -> float:
+    """
+    Get a percentile of a list of numbers (nearest rank).
+
+    param values: the numbers
+    param pct: the percentile wanted, 0 to 100
+    return: the value at that percentile, 0.0 for an empty list
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def run_one(name: str, gram: str, plain: str, engine: str, workers: int,
+            trace_memory: bool) -> dict:
+    """
+    Solve one cryptogram and measure it.
+
+    param name: name of the cryptogram in the report
+    param gram: the cryptogram
+    param plain: the correct plain text
+    param engine: the solver engine to use (see cryptogram.find_best_solution)
+    param workers: number of processes to solve with
+    param trace_memory: measure peak memory with tracemalloc (slow)
+    return: dictionary of measurements
+    """
+    cryptogram.reset_solver_stats()
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    answer = cryptogram.find_best_solution(gram, workers, engine)
+    seconds = time.perf_counter() - start
+    stats = cryptogram.solver_stats()
+
+    result = {"name": name,
+              "letters": sum(1 for ltr in gram if ltr.isalpha()),
+              "seconds": round(seconds, 6),
+              "prune_calls": stats.get("prune", 0),
+              "hint_runs": stats.get("hint runs", 0),
+              "hints_cut_short": stats.get("hints cut short", 0),
+              "accuracy": round(letter_accuracy(answer, plain), 4),
+              "answer": answer}
+
+    if trace_memory:
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result
+
+
+def summarize(results: list) -> dict:
+    """
+    Summarize the per-cryptogram measurements.
+
+    param results: list of run_one dictionaries
+    return: dictionary of summary values
+    """
+    seconds = [res["seconds"] for res in results]
+    summary = {"count": len(results),
+               "p50_seconds": percentile(seconds, 50),
+               "p90_seconds": percentile(seconds, 90),
+               "p99_seconds": percentile(seconds, 99),
+               "max_seconds": max(seconds, default=0.0),
+               "total_seconds": round(sum(seconds), 6),
+               "prune_calls": sum(res["prune_calls"] for res in results),
+               "hint_runs": sum(res["hint_runs"] for res in results),
+               "hints_cut_short": sum(res["hints_cut_short"] for res in results),
+               "accuracy": round(sum(res["accuracy"] for res in results)
+                                 / max(1, len(results)), 4)}
+
+    peaks = [res["peak_bytes"] for res in results if "peak_bytes" in res]
+    if peaks:
+        summary["peak_bytes"] = max(peaks)
+    if resource is not None:
+        # kilobytes on Linux
+        summary["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return summary
+
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compare a summary to a saved one.
+
+    param summary: summary of this run
+    param baseline: summary of the saved run
+    param tolerance: allowed slow down (fraction)
+    return: list of regression descriptions (empty if none)
+    """
+    regressions = []
+
+    if summary["p50_seconds"] > baseline["p50_seconds"] * (1 + tolerance):
+        regressions.append(f"median latency {summary['p50_seconds']:.3f}s, "
+                           f"baseline {baseline['p50_seconds']:.3f}s")
+    if summary["p90_seconds"] > baseline["p90_seconds"] * (1 + tolerance):
+        regressions.append(f"p90 latency {summary['p90_seconds']:.3f}s, "
+                           f"baseline {baseline['p90_seconds']:.3f}s")
+    if summary["accuracy"] < baseline["accuracy"] - _ACCURACY_TOLERANCE:
+        regressions.append(f"accuracy {summary['accuracy']:.4f}, "
+                           f"baseline {baseline['accuracy']:.4f}")
+
+    return regressions
+
+
+def different_settings(settings: dict, baseline: dict) -> list:
+    """
+    Find the settings that make a run not comparable to a saved one.
+
+    param settings: settings of this run
+    param baseline: settings of the saved run
+    return: list of descriptions of the differences (empty if none)
+    """
+    return [f"{key} {settings[key]!r}, baseline {baseline[key]!r}"
+            for key in _COMPARED_SETTINGS
+            if key in baseline and settings[key] != baseline[key]]
+
+
+def savings(summary: dict, baseline: dict) -> list:
+    """
+    Describe how much solver work a run saved compared to a saved one.
+
+    param summary: summary of this run
+    param baseline: summary of the saved run
+    return: list of descriptions, one per work counter
+    """
+    lines = []
+    for key, label in (("prune_calls", "prune calls"), ("hint_runs", "hint runs")):
+        # summaries saved before a counter existed do not have it
+        if key not in baseline:
+            continue
+        saved = baseline[key] - summary[key]
+        share = saved / baseline[key] if baseline[key] else 0.0
+        lines.append(f"{label}: {summary[key]}, baseline {baseline[key]}, "
+                     f"saved {saved} ({share:.1%})")
+    return lines
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """
+    Parse the command line.
+
+    param argv: command line arguments (sys.argv[1:] if None)
+    return: the parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the cryptogram solver.")
+    parser.add_argument("-n", "--count", type=int, default=_DEFAULT_COUNT,
+                        help=f"number of generated cryptograms (default: {_DEFAULT_COUNT})")
+    parser.add_argument("-s", "--seed", type=int, default=_DEFAULT_SEED,
+                        help=f"seed for the generated cryptograms (default: {_DEFAULT_SEED})")
+    parser.add_argument("--no-samples", action="store_true",
+                        help="skip the sample cryptograms")
+    parser.add_argument("-e", "--engine", choices=cryptogram._ENGINES, default="hints",
+                        help="solver engine (default: hints)")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="processes per solve, 0 for one per CPU (default: 1). "
+                             "Prune calls are only counted with 1.")
+    parser.add_argument("-m", "--memory", action="store_true",
+                        help="measure peak memory of each solve (slows solving)")
+    parser.add_argument("-o", "--output", metavar="FILE",
+                        help="save the results to FILE as JSON")
+    parser.add_argument("-b", "--baseline", metavar="FILE",
+                        help="compare with results saved by --output, exit with 1 "
+                             "on a regression")
+    parser.add_argument("-t", "--tolerance", type=float, default=_DEFAULT_TOLERANCE,
+                        help=f"allowed slow down as a fraction (default: {_DEFAULT_TOLERANCE})")
+    return parser.parse_args(argv)
+
+
+def main() -> int:
+    """
+    Main routine for the benchmark program.
+
+    return: 0 upon successful run, 1 if a regression was found, 2 if the
+            baseline was run with other settings.
+    """
+    args = parse_args()
+    workers = args.workers or None
+    settings = {"count": args.count, "seed": args.seed, "samples": not args.no_samples,
+                "engine": args.engine, "workers": args.workers}
+
+    # check the baseline before spending the time to solve
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as src:
+            baseline = json.load(src)
+        differences = different_settings(settings, baseline.get("settings", {}))
+        for difference in differences:
+            print("NOT COMPARABLE:", difference, file=sys.stderr)
+        if differences:
+            return 2
+
+    grams = []
+    if not args.no_samples:
+        grams += [(f"sample-{idx}", gram, plain) for idx, (gram, plain)
+                  in enumerate(zip(cryptogram._SAMPLE_GRAMS, _SAMPLE_ANSWERS))]
+    grams += generated_grams(args.count, args.seed)
+
+    # read the words up front so the first cryptogram's time does not include it
+    cryptogram.default_dictionary().load()
+
+    results = []
+    for name, gram, plain in grams:
+        result = run_one(name, gram, plain, args.engine, workers, args.memory)
+        results.append(result)
+        print(f"{name:14} {result['seconds']:9.3f}s  {result['prune_calls']:8} prunes  "
+              f"{result['hint_runs']:5} hints  {result['accuracy']:7.2%}", flush=True)
+
+    summary = summarize(results)
+    print()
+    print(f"cryptograms: {summary['count']}   accuracy: {summary['accuracy']:.2%}   "
+          f"prune calls: {summary['prune_calls']}   hint runs: {summary['hint_runs']} "
+          f"({summary['hints_cut_short']} cut short)")
+    print(f"latency p50 {summary['p50_seconds']:.3f}s  p90 {summary['p90_seconds']:.3f}s  "
+          f"p99 {summary['p99_seconds']:.3f}s  max {summary['max_seconds']:.3f}s")
+
+    report = {"settings": settings,
+              "summary": summary,
+              "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(report, out, indent=2)
+
+    if args.baseline:
+        for line in savings(summary, baseline["summary"]):
+            print(line)
+        regressions = compare(summary, baseline["summary"], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,11 +4,39 @@ Author:  Jeff Alkire
 Date:    February 2023
 Purpose: Module to create and/or solve cryptograms.
 """
+import argparse
+import array
+import asyncio
+import collections.abc
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
+import os
 import random
+import shutil
+import signal
+import socket
+import sqlite3
+import stat
 import string
+import struct
 import sys
+import tempfile
+import time
+import weakref
 
-from collections import Counter
+from collections import Counter, deque
+
+try:
+    import numpy as np
+except ImportError:     # numpy is optional, the ngram engine falls back to pure Python
+    np = None
 
 _DEBUG = True
 _SAMPLE_GRAMS = ["Xesmzdhmbebj nwramj tnqjazy qxuejj maz xedhbmzu'j xesjenz. "
@@ -42,24 +70,112 @@ _SAMPLE_GRAMS = ["Xesmzdhmbebj nwramj tnqjazy qxuejj maz xedhbmzu'j xesjenz. "
 _MOST_COMMON_LETTERS = ['e', 't', 'a', 'o', 'n']
 _MOST_COMMON_PAIRS = ['th', 'he', 'an', 're', 'er']
 _MOST_COMMON_DOUBLES = ['ll', 'ee', 'ss', 'oo', 'tt']
+# English letters, most used first.  The search tries letters in this order.
+_LETTER_FREQUENCY_ORDER = "etaoinshrdlcumwfgypbvkjxqz"
+
+_ENGINES = ["hints", "search", "ngram"]
+# Default budget of the search engine (see search_solution)
+_SEARCH_TIME_LIMIT = 30.0
+_SEARCH_NODE_LIMIT = 100000
+# Default budget of the ngram engine (see ngram_solution)
+_NGRAM_RESTARTS = 100
+_NGRAM_TIME_LIMIT = 30.0
+# Seconds between checks for a stop while waiting on worker processes
+# (see solve_anytime)
+_ANYTIME_POLL = 0.05
+
+# Solutions kept by a SolutionCache before the least recently used go.
+# Bump _CACHE_VERSION when a change to the solver changes its answers so
+# existing caches stop returning the old ones.
+_CACHE_SIZE = 10000
+_CACHE_VERSION = 7
+
+# Seconds a server request may take when it does not give a timeout
+_REQUEST_TIMEOUT = 60.0
+# Longest request line the server reads (a cryptogram of a few MB); a
+# longer one is answered with an error and ends the connection
+_REQUEST_LINE_LIMIT = 1 << 24
+# Requests a client keeps waiting on the server at once
+_CLIENT_WINDOW = 16
+
+# Streaming decode (see solve_stream): characters read at a time, different
+# words counted at most, and the number of most common words the key is
+# solved from
+_STREAM_CHUNK = 1 << 16
+_STREAM_TRACKED_WORDS = 10000
+_STREAM_KEY_WORDS = 40
+
+# Cryptograms generate_cryptograms makes from one random seed (and hands a
+# worker at a time)
+_GENERATE_BATCH = 1000
+# Number of different substitution keys (see random_key)
+_KEY_COUNT = math.factorial(len(string.ascii_lowercase))
+
+# Optional table of English quadgram counts, one "QUAD count" per line.
+# Without it the ngram engine counts the quadgrams of the dictionary words.
+_NGRAM_FILE = "english_quadgrams.txt"
+_NGRAM_LENGTH = 4
+# n-gram symbol for the start or end of a word (a-z are 0-25)
+_BOUNDARY = len(string.ascii_lowercase)
+# bytes other than a-z and '{' (a boundary) when counting n-grams
+_NON_NGRAM_BYTES = bytes(byte for byte in range(256) if not ord('a') <= byte <= ord('{'))
+
+# Candidate domains can also be held as bit masks.  Bit n of a mask is set
+# when the n-th letter of the alphabet is a possible decryption value.
+_ALL_LETTERS = (1 << len(string.ascii_lowercase)) - 1
+# Flag bit marking a cipher letter nothing has been learned about yet (the
+# same as a letter missing from a possible values dictionary).
+_UNKNOWN = 1 << len(string.ascii_lowercase)
+_UNCONSTRAINED = _UNKNOWN | _ALL_LETTERS
+_LETTER_BITS = {ltr: 1 << idx for idx, ltr in enumerate(string.ascii_lowercase)}
+
+# Running totals of solver work (see solver_stats)
+_STATS = Counter()
+# Detailed timers and counters, only kept while profiling (see enable_profiling)
+_PROFILE = None
+
+# Number of template match results remembered (see prune_cache_info)
+_PRUNE_CACHE_SIZE = 1 << 16
 
 _WORD_FILE = "words_alpha.txt"
 # _WORD_FILE = "/usr/share/dict/american-english"
 
-# define GLOBAL _WORD_LIST set for use in this module only
-with open(_WORD_FILE, "r", encoding="utf-8") as fd:
-    _WORD_LIST = set(fd.read().lower().split())
-
-
-def is_english_word(word: str) -> bool:
+# Precompiled word index (see load_word_index).  Rebuilt automatically
+# whenever the word file it was built from changes.
+_INDEX_FILE = "words_alpha.idx"
+_INDEX_MAGIC = b"CGIDX"
+_INDEX_VERSION = 4
+# magic, version, source size, source mtime (ns), source sha256, and the
+# same for the frequency file (all 0 without one)
+_INDEX_HEADER = struct.Struct("<5sHQq32sQq32s")
+# Tables of the flat index layout (see _pack_word_index).  Offsets are
+# from the start of the index.
+_INDEX_COUNT = struct.Struct("<I")
+# word length, number of words, offset of the words
+_INDEX_WORDS = struct.Struct("<IIQ")
+# template length, number of templates, offset of the templates, offset
+# of their bucket table
+_INDEX_TEMPLATES = struct.Struct("<IIQQ")
+# a tier's highest word rank
+_INDEX_TIER = struct.Struct("<I")
+
+# Optional list of words, most common first (see Dictionary).  The words of
+# each template are tiered by rank: the most common _WORD_TIERS[0] words,
+# then the next most common up to _WORD_TIERS[1], ..., then all the rest.
+_FREQUENCY_FILE = "word_frequencies.txt"
+_WORD_TIERS = (10000, 50000)
+
+
+def is_english_word(word: str, dictionary: "Dictionary" = None) -> bool:
     """
     Determine if a word is English by looking into the word list file and
     looking for it.
 
     param word:  Word to look up
+    param dictionary: the words to use (default_dictionary() if None)
     return:      true/false if file is/is not in the english word list
     """
-    return word.lower() in _WORD_LIST
+    return (dictionary or default_dictionary()).is_english_word(word)
 
 
 def word_template(word: str) -> str:
@@ -91,6 +207,27 @@ def word_template(word: str) -> str:
     return ''.join(return_value)
 
 
+def gram_template(gram: str) -> (str, str):
+    """
+    Convert a cryptogram into a template, like word_template does for a
+    word but over the whole text: each different letter is replaced by
+    a, b, c, ... in order of first use (ignoring case) and everything else
+    is kept as it is.  Cryptograms that only differ by their substitution
+    key have the same template.
+
+    Example:
+        Qsf blbjp, kqx qsf -> abc dedfg, hai abc
+
+    param gram: the cryptogram
+    return: tuple of the template and the cryptogram's different letters
+            (lowercase) in order of first use
+    """
+    lowered = gram.lower()
+    letters = "".join(dict.fromkeys(ltr for ltr in lowered if ltr in _LETTER_BITS))
+    relabel = str.maketrans(letters, string.ascii_lowercase[:len(letters)])
+    return lowered.translate(relabel), letters
+
+
 def build_word_templates(word_list: list = None) -> dict:
     """
     Given a list of words, create a word template for each word and store them in
@@ -102,7 +239,7 @@ def build_word_templates(word_list: list = None) -> dict:
                         and a list of words from the list matching the template.
     """
     if word_list is None:
-        word_list = _WORD_LIST
+        word_list = default_dictionary().words
 
     char_templates = {}  # templates
 
@@ -117,21 +254,711 @@ def build_word_templates(word_list: list = None) -> dict:
     return char_templates
 
 
-_WORD_TEMPLATES = build_word_templates()
+def _source_signature(word_file: str) -> (int, int):
+    """
+    Get the cheap identity of a word file used to validate an index.
+
+    param word_file: path of the word file
+    return: tuple of the file size and modification time in nanoseconds
+    """
+    stats = os.stat(word_file)
+    return stats.st_size, stats.st_mtime_ns
+
+
+def _source_hash(word_file: str) -> bytes:
+    """
+    Get the sha256 digest of a word file.
+
+    param word_file: path of the word file
+    return: the 32 byte digest
+    """
+    digest = hashlib.sha256()
+    with open(word_file, "rb") as src:
+        for block in iter(lambda: src.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def _bucket_entry(tiers: int) -> struct.Struct:
+    """
+    param tiers: number of word tiers limits in the index
+    return: the layout of a bucket table entry: offset of the bucket's
+            words, number of words and the number of words within each
+            tier limit
+    """
+    return struct.Struct("<QI" + "I" * tiers)
+
+
+def read_word_ranks(frequency_file: str) -> list:
+    """
+    Read a word frequency file: one word per line, most common first.
+    Anything after the word on a line (a count, etc.) is ignored.
+
+    param frequency_file: path of the frequency file
+    return: list of the (lowercase) words, most common first
+    """
+    with open(frequency_file, "r", encoding="utf-8") as src:
+        return [line.split()[0].lower() for line in src if line.strip()]
+
+
+def _source_matches(source_file: str, size: int, mtime: int, sha: bytes) -> bool:
+    """
+    Check that a file is the one an index was built from.
+
+    param source_file: path of the file, or None if there is no file
+    param size: the file size recorded in the index
+    param mtime: the modification time recorded in the index
+    param sha: the sha256 digest recorded in the index
+    return: True if the file matches (same size and modification time, or
+            failing that, the same sha256 hash)
+    """
+    if source_file is None:
+        return size == 0 and mtime == 0 and sha == bytes(32)
+    return (size, mtime) == _source_signature(source_file) \
+        or sha == _source_hash(source_file)
+
+
+def _pack_word_index(word_list, header: bytes = None, ranked: list = None) -> bytes:
+    """
+    Lay out a word list in the flat index format.  Everything is stored as
+    fixed width records, so nothing has to be unpacked to use it:
+
+        header (see _INDEX_HEADER)
+        count, then one _INDEX_TIER entry per tier limit
+        count, then one _INDEX_WORDS entry per word length
+        count, then one _INDEX_TEMPLATES entry per template length
+        the words of each length, sorted (for binary search)
+        the templates of each length, sorted, and for each of them a
+        bucket entry (see _bucket_entry) pointing to the words matching it
+
+    The words of a bucket are in rank order, the unranked ones last in
+    alphabetical order, so each tier of a bucket is a prefix of it.  Words
+    that are not plain ASCII are left out.
+
+    param word_list: iterable of (lowercase) words
+    param header: the index header, by default one with no source
+    param ranked: words most common first (see read_word_ranks), or None
+                  to keep all the words in one tier
+    return: the index
+    """
+    if header is None:
+        header = _INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION, 0, 0, bytes(32),
+                                    0, 0, bytes(32))
+
+    words = sorted({word for word in word_list if word and word.isascii()})
+    word_lengths = {}
+    for word in words:
+        word_lengths.setdefault(len(word), []).append(word)
+
+    limits = _WORD_TIERS if ranked else ()
+    ranks = {}
+    known = set(words)
+    for word in ranked or ():
+        if word in known and word not in ranks:
+            ranks[word] = len(ranks)
+    # past every tier but the last, however few words are ranked
+    unranked = max((len(ranks),) + limits)
+    bucket_entry = _bucket_entry(len(limits))
+
+    templates = build_word_templates(words)
+    template_lengths = {}
+    for tmpl in sorted(templates):
+        templates[tmpl].sort(key=lambda word: ranks.get(word, unranked))
+        template_lengths.setdefault(len(tmpl), []).append(tmpl)
+
+    offset = (len(header) + 3 * _INDEX_COUNT.size
+              + len(limits) * _INDEX_TIER.size
+              + len(word_lengths) * _INDEX_WORDS.size
+              + len(template_lengths) * _INDEX_TEMPLATES.size)
+    tables = [_INDEX_COUNT.pack(len(limits))]
+    tables.extend(_INDEX_TIER.pack(limit) for limit in limits)
+    tables.append(_INDEX_COUNT.pack(len(word_lengths)))
+    blocks = []
+
+    for length, group in word_lengths.items():
+        tables.append(_INDEX_WORDS.pack(length, len(group), offset))
+        blocks.append("".join(group).encode("ascii"))
+        offset += len(blocks[-1])
+
+    tables.append(_INDEX_COUNT.pack(len(template_lengths)))
+    for length, group in template_lengths.items():
+        buckets = []
+        for tmpl in group:
+            bucket = templates[tmpl]
+            tiers = [sum(1 for word in bucket if ranks.get(word, unranked) < limit)
+                     for limit in limits]
+            buckets.append(bucket_entry.pack(offset, len(bucket), *tiers))
+            blocks.append("".join(templates[tmpl]).encode("ascii"))
+            offset += len(blocks[-1])
+        # templates can use more than 26 letters, see word_template
+        blocks.append("".join(group).encode("latin-1"))
+        tables.append(_INDEX_TEMPLATES.pack(length, len(group), offset,
+                                            offset + len(blocks[-1])))
+        blocks.append(b"".join(buckets))
+        offset += len(blocks[-2]) + len(blocks[-1])
+
+    return b"".join([header] + tables + blocks)
+
+
+def _find_record(data, offset: int, width: int, count: int, key: bytes) -> int:
+    """
+    Binary search sorted fixed width records.
+
+    param data: the buffer holding the records
+    param offset: offset of the first record
+    param width: size of each record
+    param count: number of records
+    param key: the record to look for
+    return: the record's number or -1 if it is not there
+    """
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        start = offset + middle * width
+        record = data[start:start + width]
+        if record < key:
+            low = middle + 1
+        elif record > key:
+            high = middle
+        else:
+            return middle
+    return -1
+
+
+class WordBucket(collections.abc.Sequence):
+    """
+    The words matching one template, read straight from the index buffer.
+    All of them have the template's length.  The most common words come
+    first: tiers[n] is the number of words in tier n (and the tiers before
+    it), the last tier being the whole bucket.
+    """
+    __slots__ = ("data", "offset", "width", "count", "tiers")
+
+    def __init__(self, data, offset: int, width: int, count: int, tiers: tuple = ()):
+        self.data, self.offset, self.width, self.count = data, offset, width, count
+        self.tiers = tuple(tiers) + (count,)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[word_no] for word_no in range(*idx.indices(self.count))]
+        if idx < 0:
+            idx += self.count
+        if not 0 <= idx < self.count:
+            raise IndexError("word bucket index out of range")
+        start = self.offset + idx * self.width
+        return self.data[start:start + self.width].decode("ascii")
+
+    def __iter__(self):
+        text = self.data[self.offset:self.offset + self.count * self.width].decode("ascii")
+        return (text[start:start + self.width] for start in range(0, len(text), self.width))
+
+    def __repr__(self) -> str:
+        return f"WordBucket({list(self)!r})"
+
+    def column(self, pos: int) -> bytes:
+        """
+        param pos: a letter position
+        return: the letter at that position of every word, as bytes
+        """
+        start = self.offset + pos
+        return self.data[start:self.offset + self.count * self.width:self.width]
+
+
+class _IndexWords(collections.abc.Set):
+    """ set like view of the words of a WordIndex """
+
+    def __init__(self, index: "WordIndex"):
+        self._index = index
+
+    def __contains__(self, word) -> bool:
+        return isinstance(word, str) and self._index.has_word(word)
+
+    def __iter__(self):
+        data = self._index.data
+        for width, (count, offset) in self._index.word_lengths.items():
+            yield from WordBucket(data, offset, width, count)
+
+    def __len__(self) -> int:
+        return sum(count for count, _ in self._index.word_lengths.values())
+
+
+class _IndexTemplates(collections.abc.Mapping):
+    """ read only dictionary like view of the template buckets of a WordIndex """
+
+    def __init__(self, index: "WordIndex"):
+        self._index = index
+
+    def __getitem__(self, tmpl: str) -> WordBucket:
+        bucket = self._index.bucket(tmpl) if isinstance(tmpl, str) else None
+        if bucket is None:
+            raise KeyError(tmpl)
+        return bucket
+
+    def __contains__(self, tmpl) -> bool:
+        return isinstance(tmpl, str) and self._index.bucket(tmpl) is not None
+
+    def __iter__(self):
+        data = self._index.data
+        for width, (count, offset, _) in self._index.template_lengths.items():
+            text = data[offset:offset + count * width].decode("latin-1")
+            yield from (text[start:start + width] for start in range(0, len(text), width))
+
+    def __len__(self) -> int:
+        return sum(count for count, _, _ in self._index.template_lengths.values())
+
 
+class WordIndex:
+    """
+    A word index in the flat layout written by build_word_index.  Nothing is
+    unpacked: word and template lookups binary search the buffer and the
+    words of a template are read from it as they are used.  When the buffer
+    is a memory mapped index file every process using the file shares the
+    same pages.
+    """
+
+    def __init__(self, data):
+        """
+        param data: the index (bytes, or a read only mmap of an index file)
+        """
+        self.data = data
+        # word length -> (number of words, offset)
+        self.word_lengths = {}
+        # template length -> (number of templates, offset, bucket table offset)
+        self.template_lengths = {}
+
+        offset = _INDEX_HEADER.size
+        count, = _INDEX_COUNT.unpack_from(data, offset)
+        offset += _INDEX_COUNT.size
+        # highest word rank of each tier but the last (see _WORD_TIERS)
+        self.tier_limits = tuple(limit for limit, in _INDEX_TIER.iter_unpack(
+            data[offset:offset + count * _INDEX_TIER.size]))
+        offset += count * _INDEX_TIER.size
+        self._bucket_entry = _bucket_entry(count)
+
+        for table, lengths in ((_INDEX_WORDS, self.word_lengths),
+                               (_INDEX_TEMPLATES, self.template_lengths)):
+            count, = _INDEX_COUNT.unpack_from(data, offset)
+            offset += _INDEX_COUNT.size
+            for length, *entry in table.iter_unpack(data[offset:offset + count * table.size]):
+                lengths[length] = tuple(entry)
+            offset += count * table.size
+        # buckets of the templates looked up so far (None if not found)
+        self._buckets = {}
+        self._fingerprint = None
+        self.words = _IndexWords(self)
+        self.templates = _IndexTemplates(self)
+
+    @property
+    def fingerprint(self) -> bytes:
+        """
+        sha256 digest identifying the words and tiers of the index: from
+        the hashes of the files it was built from, or from the whole index
+        when it was not built from a file.
+        """
+        if self._fingerprint is None:
+            _, _, _, _, sha, _, _, frequency_sha = _INDEX_HEADER.unpack_from(self.data)
+            digest = hashlib.sha256(repr(self.tier_limits).encode("ascii"))
+            if sha == bytes(32):
+                digest.update(self.data)
+            else:
+                digest.update(sha + frequency_sha)
+            self._fingerprint = digest.digest()
+        return self._fingerprint
+
+    def has_word(self, word: str) -> bool:
+        """
+        param word: a lowercase word
+        return: True if the word is in the index
+        """
+        count, offset = self.word_lengths.get(len(word), (0, 0))
+        if count == 0 or not word.isascii():
+            return False
+        return _find_record(self.data, offset, len(word), count, word.encode("ascii")) >= 0
+
+    def bucket(self, tmpl: str) -> WordBucket:
+        """
+        param tmpl: a word template
+        return: the words matching the template or None if there are none
+        """
+        try:
+            return self._buckets[tmpl]
+        except KeyError:
+            pass
+
+        bucket = None
+        count, offset, table = self.template_lengths.get(len(tmpl), (0, 0, 0))
+        try:
+            key = tmpl.encode("latin-1")
+        except UnicodeEncodeError:
+            count = 0
+        if count:
+            tmpl_no = _find_record(self.data, offset, len(tmpl), count, key)
+            if tmpl_no >= 0:
+                words_offset, words, *tiers = self._bucket_entry.unpack_from(
+                    self.data, table + tmpl_no * self._bucket_entry.size)
+                bucket = WordBucket(self.data, words_offset, len(tmpl), words, tiers)
+
+        self._buckets[tmpl] = bucket
+        return bucket
+
+
+def build_word_index(word_file: str = _WORD_FILE,
+                     index_file: str = _INDEX_FILE,
+                     frequency_file: str = None) -> WordIndex:
+    """
+    Read a word file, build the word templates for it and save both in a
+    binary index file so later runs can skip this work.  Failure to write
+    the index (read only directory, etc.) is not an error.
+
+    param word_file: path of the word file (one word per line)
+    param index_file: path of the index file to create
+    param frequency_file: path of the word frequency file to tier the words
+                          by (see read_word_ranks), or None for one tier
+    return: the index
+    """
+    with open(word_file, "r", encoding="utf-8") as src:
+        word_list = src.read().lower().split()
+    ranked = None
+    sources = [word_file]
+    if frequency_file is not None:
+        ranked = read_word_ranks(frequency_file)
+        sources.append(frequency_file)
+
+    identity = []
+    for source in sources:
+        identity.extend(_source_signature(source) + (_source_hash(source),))
+    identity.extend((0, 0, bytes(32)) * (2 - len(sources)))
+    header = _INDEX_HEADER.pack(_INDEX_MAGIC, _INDEX_VERSION, *identity)
+    data = _pack_word_index(word_list, header, ranked)
+
+    tmp_file = f"{index_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "wb") as out:
+            out.write(data)
+        os.replace(tmp_file, index_file)
+    except OSError:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+
+    return WordIndex(data)
+
+
+def read_word_index(word_file: str = _WORD_FILE,
+                    index_file: str = _INDEX_FILE,
+                    frequency_file: str = None) -> WordIndex:
+    """
+    Open a word index built by build_word_index.  The index is memory mapped
+    read only and used in place, so processes using the same index file
+    share one copy of it.  It is only used if it matches the current version
+    of the index format, the current word tiers and the files it was built
+    from (same size and modification time, or failing that, the same sha256
+    hash).
+
+    param word_file: path of the word file the index must match
+    param index_file: path of the index file
+    param frequency_file: path of the word frequency file the index must
+                          match, or None if it must have no tiers
+    return: the index, or None if it is missing, stale or unreadable.
+    """
+    data = None
+    try:
+        with open(index_file, "rb") as src:
+            data = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(data) < _INDEX_HEADER.size:
+            raise ValueError("index file too short")
+        magic, version, *identity = _INDEX_HEADER.unpack_from(data)
+        if magic != _INDEX_MAGIC or version != _INDEX_VERSION:
+            raise ValueError("not a current index file")
+        if not _source_matches(word_file, *identity[:3]) \
+                or not _source_matches(frequency_file, *identity[3:]):
+            raise ValueError("index file is stale")
+        index = WordIndex(data)
+        if index.tier_limits != (_WORD_TIERS if frequency_file else ()):
+            raise ValueError("index file has other word tiers")
+        return index
+    except (OSError, ValueError, struct.error):
+        if data is not None:
+            data.close()
+        return None
+
+
+def load_word_index(word_file: str = _WORD_FILE,
+                    index_file: str = _INDEX_FILE,
+                    frequency_file: str = None) -> WordIndex:
+    """
+    Get the word index, from the index file when it is current, otherwise
+    by (re)building it from the word file.
+
+    param word_file: path of the word file
+    param index_file: path of the index file
+    param frequency_file: path of the word frequency file, or None
+    return: the index
+    """
+    index = read_word_index(word_file, index_file, frequency_file)
+    if index is None:
+        index = build_word_index(word_file, index_file, frequency_file)
+    return index
+
+
+def _default_word_file(file_name: str = _WORD_FILE) -> str:
+    """
+    Find the default word file: words_alpha.txt in the current directory,
+    or if there is none there, the one next to this module.
+
+    param file_name: name of the file to find
+    return: path of the word file
+    """
+    if os.path.exists(file_name):
+        return file_name
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), file_name)
+
+
+class Dictionary:
+    """
+    The English words the solver can use, with their templates.  Nothing
+    is read until the words are first needed, and the words are then used
+    in place from the memory mapped word index file (see load_word_index).
+
+    With a word frequency file the words of each template are split into
+    tiers, most common words first (see _WORD_TIERS), and the solver only
+    widens to the less common tiers for the words that need them (see
+    match_template).
+
+    Any number of dictionaries can be used in one process.  The module
+    level functions take an optional dictionary and use
+    default_dictionary() when none is given.
+    """
+
+    def __init__(self, word_file: str = None, index_file: str = None, words=None,
+                 frequency_file: str = None):
+        """
+        param word_file: path of the word file (one word per line).  Defaults
+                         to words_alpha.txt (see _default_word_file).
+        param index_file: path of the word index file.  Defaults to the word
+                          file's path with an .idx extension.
+        param words: iterable of words to use instead of a word file
+        param frequency_file: path of a word frequency file (see
+                              read_word_ranks).  Defaults to
+                              word_frequencies.txt if there is one (found like
+                              words_alpha.txt); "" for no word tiers.
+        """
+        if frequency_file is None:
+            frequency_file = _default_word_file(_FREQUENCY_FILE)
+            if not os.path.exists(frequency_file):
+                frequency_file = ""
+        self.frequency_file = os.path.abspath(frequency_file) if frequency_file else None
+
+        if words is not None:
+            self._word_source = tuple(words)
+            self.word_file, self.index_file = None, None
+            self._token = f"{os.getpid()}.{next(_WORD_LIST_TOKENS)}"
+            _WORD_LISTS[self._token] = self
+        else:
+            self._word_source = None
+            self._token = None
+            self.word_file = os.path.abspath(word_file or _default_word_file())
+            self.index_file = os.path.abspath(index_file or
+                                              os.path.splitext(self.word_file)[0] + ".idx")
+            _DICTIONARIES.setdefault((self.word_file, self.index_file,
+                                      self.frequency_file), self)
+
+        self._index = None
+        self._bits = {}
+        # template match results, see match_template
+        self.match_template = functools.lru_cache(maxsize=_PRUNE_CACHE_SIZE)(
+            self._match_template)
+
+    def __reduce__(self):
+        # Worker processes look up their own copy of a dictionary by name
+        # (see _dictionary_for and _word_list_for), so the words are never
+        # pickled with each task.
+        if self._word_source is None:
+            return _dictionary_for, (self.word_file, self.index_file, self.frequency_file)
+        return _word_list_for, (self._token,)
+
+    def load(self) -> "Dictionary":
+        """
+        Read the words and templates if that has not been done yet.
+
+        return: this dictionary
+        """
+        if self._index is None:
+            start = time.perf_counter()
+            if self._word_source is None:
+                self._index = load_word_index(self.word_file, self.index_file,
+                                              self.frequency_file)
+            else:
+                ranked = None
+                if self.frequency_file is not None:
+                    ranked = read_word_ranks(self.frequency_file)
+                self._index = WordIndex(_pack_word_index(
+                    (word.lower() for word in self._word_source), ranked=ranked))
+
+            if _PROFILE is not None:
+                _PROFILE.add_time("index load", time.perf_counter() - start)
+
+        return self
+
+    @property
+    def words(self) -> collections.abc.Set:
+        """ read only set of the (lowercase) words """
+        return self.load()._index.words
+
+    @property
+    def templates(self) -> collections.abc.Mapping:
+        """ read only mapping of word template to the words matching it """
+        return self.load()._index.templates
+
+    @property
+    def fingerprint(self) -> bytes:
+        """ digest identifying the words of this dictionary (see WordIndex) """
+        return self.load()._index.fingerprint
+
+    @property
+    def tiers(self) -> int:
+        """ number of word tiers (1 without a word frequency file) """
+        return len(self.load()._index.tier_limits) + 1
+
+    def is_english_word(self, word: str) -> bool:
+        """
+        param word: Word to look up
+        return: True if the word is in this dictionary
+        """
+        return self.load()._index.has_word(word.lower())
+
+    def template_bits(self, tmpl: str) -> (int, tuple):
+        """
+        Get the inverted index of the words matching a template.  Word n of
+        the template's bucket is bit n of each bitset.  For each different
+        letter in the template there is one bitset per English letter,
+        marking the words with that letter in that letter's place.  Bitsets
+        are built on first use and kept for later calls.
+
+        param tmpl: the word template
+        return: tuple of the bitset of words made only of letters a-z, and
+                a tuple (one per different template letter) of the 26
+                letter bitsets.
+        """
+        index = self._bits.get(tmpl)
+        if index is None:
+            words = self.load()._index.bucket(tmpl)
+            count = len(words) if words is not None else 0
+            size = (count + 7) // 8
+            letter_bits = []
+            alpha = (1 << count) - 1
+
+            for tmpl_ltr in sorted(set(tmpl)):
+                bitmaps = [bytearray(size) for _ in string.ascii_lowercase]
+                if words is not None:
+                    for word_no, ltr in enumerate(words.column(tmpl.index(tmpl_ltr))):
+                        ltr -= ord('a')
+                        if 0 <= ltr < len(bitmaps):
+                            bitmaps[ltr][word_no >> 3] |= 1 << (word_no & 7)
+
+                bits = tuple(int.from_bytes(bitmap, "little") for bitmap in bitmaps)
+                alpha &= functools.reduce(int.__or__, bits)
+                letter_bits.append(bits)
+
+            index = alpha, tuple(letter_bits)
+            self._bits[tmpl] = index
+
+        return index
+
+    def _match_template(self, tmpl: str, allowed: tuple, tier: int = -1) -> tuple:
+        """
+        Find the letters used by the template's words that only use allowed
+        letters.  Called through match_template, which remembers results:
+        the same template with the same allowed letters comes up again and
+        again, for repeated words, for different words with the same
+        template and across hint runs.
+
+        param tmpl: the word template (must be in this dictionary)
+        param allowed: allowed letter mask for each different letter in the
+                       template (template letter a, b, c, ...)
+        param tier: only use the words of this tier and the ones before it
+                    (see tiers), the last tier (all words) by default
+        return: tuple of the masks of letters found for each different letter
+                in the template (all 0 if no word fits).
+        """
+        count = self.templates[tmpl].tiers[tier]
+        if _PROFILE is not None:
+            _PROFILE.count("template words filtered", count)
+        fits, letter_bits = self.template_bits(tmpl)
+        return _match_template_bits((fits & ((1 << count) - 1), letter_bits), allowed)
+
+
+# File based dictionaries by (word file, index file), see _dictionary_for
+_DICTIONARIES = {}
+# Dictionaries of word lists by name, see _word_list_for
+_WORD_LISTS = weakref.WeakValueDictionary()
+_WORD_LIST_TOKENS = itertools.count()
+# The word lists a worker that was not forked was sent (see _start_worker)
+_SENT_WORD_LISTS = []
+
+
+def _dictionary_for(word_file: str, index_file: str, frequency_file: str) -> Dictionary:
+    """
+    Get this process's dictionary for a word file, creating it if needed.
+    Used to unpickle dictionaries sent to worker processes; a forked worker
+    finds the (already loaded) dictionary it inherited.
+
+    param word_file: path of the word file
+    param index_file: path of the word index file
+    param frequency_file: path of the word frequency file (None if none)
+    return: the dictionary
+    """
+    dictionary = _DICTIONARIES.get((word_file, index_file, frequency_file))
+    if dictionary is None:
+        dictionary = Dictionary(word_file, index_file, frequency_file=frequency_file or "")
+    return dictionary
+
+
+def _word_list_for(token: str) -> Dictionary:
+    """
+    Get this process's dictionary for a word list.  Used to unpickle
+    dictionaries sent to worker processes; a forked worker finds the one
+    it inherited, any other worker the one it was sent when it started
+    (see process_pool).
+
+    param token: the name of the word list dictionary
+    return: the dictionary
+    """
+    dictionary = _WORD_LISTS.get(token)
+    if dictionary is None:
+        raise LookupError(f"the words of dictionary {token} were not sent to this process")
+    return dictionary
+
+
+@functools.lru_cache(maxsize=None)
+def default_dictionary() -> Dictionary:
+    """
+    Get the dictionary used when none is given: words_alpha.txt (see
+    _default_word_file).  It is created on first use and, like any
+    Dictionary, only reads the words when they are needed.
+
+    return: the default dictionary
+    """
+    return Dictionary()
 
-def possible_decrypt_values(template: str) -> dict:
+
+def possible_decrypt_values(template: str, dictionary: Dictionary = None) -> dict:
     """
     Given a word template,
 
     param t: word template to work with
+    param dictionary: the words to use (default_dictionary() if None)
     return:  dictionary of all possible values for a given letter in the word.
     """
     try:
         tmpl = word_template(template.lower())
         decrypt_options = {}
 
-        possible_words = _WORD_TEMPLATES[tmpl]
+        possible_words = (dictionary or default_dictionary()).templates[tmpl]
 
         for idx, ltr in enumerate(template.lower()):
             for wrd in possible_words:
@@ -255,7 +1082,8 @@ def build_answer(cryptogram: str, ltr_filter: dict) -> str:
         if len(answer_letters) > 5:
             result.append(str(len(answer_letters)))
         else:
-            for item in answer_letters:
+            # sorted so the same domains always render the same way
+            for item in sorted(answer_letters):
                 item = match_case(cryptogram[idx], item)
                 result.append(item)
         if len(answer_letters) > 1:
@@ -272,56 +1100,22 @@ def clean_known(valids: dict) -> dict:
     param valids: the dictionary of possible decryption values
     return: the updated possible decrypt values dictionary
     """
-    singles = {}
-    for key, val in valids.items():
-        if len(val) == 1:
-            singles[key] = list(val)[0]
-
-    for key, val in valids.items():
-        if key in singles:
-            continue
-
-        for ltr in singles.values():
-            try:
-                val.remove(ltr)
-                valids[key] = val
-            except KeyError:
-                pass
-
+    valids.update(masks_to_possibles(clean_known_masks(possibles_to_masks(valids))))
     return valids
 
 
-def prune(word: str, valids: dict) -> dict:
+def prune(word: str, valids: dict, dictionary: Dictionary = None) -> dict:
     """
     Remove any values from the possible decryption values dictionary
     that are not possible for the supplied (encrypted) word.
 
     param word: the encrypted word
     param valids: the dictionary of possible decryption values
+    param dictionary: the words to use (default_dictionary() if None)
     return: the updated possible decrypt values dictionary
     """
-    std_template = word_template(word.lower())
-    matches = _WORD_TEMPLATES.get(std_template, {})
-    valid_for_word: dict = {}
-
-    for current_match in matches:
-        valid_for_match: dict = {}
-
-        for index, _ in enumerate(current_match):
-            ltr_encr = word[index]
-            ltr_valid = valids.get(ltr_encr, set())
-
-            ltr_mtch = current_match[index]
-
-            if 0 == len(ltr_valid) or ltr_mtch in ltr_valid:
-                valid_for_match = add_to_valids(valid_for_match, ltr_encr, ltr_mtch)
-            else:
-                valid_for_match = {}
-                break
-
-        valid_for_word = union_possibles(valid_for_word, valid_for_match)
-
-    return intersect_possibles(valids, valid_for_word)
+    return masks_to_possibles(prune_masks(word.lower(), possibles_to_masks(valids),
+                                          dictionary))
 
 
 def filter_size(letter_filter: dict) -> int:
@@ -333,288 +1127,3097 @@ def filter_size(letter_filter: dict) -> int:
     return: the sum of the number of possible decryption letters for each
             letter in the alphabet.
     """
-    sze = 0
-    for ltr in string.ascii_lowercase:
-        options = letter_filter.get(ltr, '')
-        if 0 == len(options):
-            sze += len(string.ascii_lowercase)
-        else:
-            sze += len(options)
+    return filter_size_masks(possibles_to_masks(letter_filter))
 
-    return sze
 
+def letters_to_mask(letters) -> int:
+    """
+    Convert a collection of letters into a bit mask.
 
-def print_possibles(dct: dict) -> None:
+    param letters: the letters (any iterable of single characters)
+    return: mask with the bit for each lowercase letter set.  Other
+            characters are ignored.
     """
-    Print the possible values dictionary in a compact way.  For debugging
+    mask = 0
+    for ltr in letters:
+        mask |= _LETTER_BITS.get(ltr.lower(), 0)
+    return mask
 
-    param dct: the possible values dictionary
+
+def mask_to_letters(mask: int) -> set:
     """
-    if _DEBUG:
-        print('     ', end='')
-        for key, val in dct.items():
-            print(key.upper(), end=':')
-            for ltr in sorted(val):
-                print(ltr, end='')
-            print(',  ', end='')
+    Convert a bit mask into the set of letters it holds.
 
-        print()
+    param mask: the bit mask
+    return: set of lowercase letters whose bits are set in the mask
+    """
+    return {ltr for ltr, bit in _LETTER_BITS.items() if mask & bit}
 
 
-def solve_cryptogram(gram: str, valids: dict) -> str:
+def possibles_to_masks(valids: dict) -> list:
     """
-    Given a cryptogram, attempt to solve it.
+    Convert a possible decryption values dictionary into a list of 26 bit
+    masks, one for each cipher letter a-z.  Letters missing from the
+    dictionary are marked unconstrained.  An empty set (a letter with no
+    possible value left) becomes 0.
 
-    param gram: The original cryptogram
-    return: The answer or near answer as a string
+    param valids: the dictionary of possible decryption values
+    return: list of masks indexed by cipher letter
     """
-    words = gram.lower().translate(str.maketrans('', '', string.punctuation)).split()
-    decryption_possibilities = valids
+    masks = []
+    for ltr in string.ascii_lowercase:
+        if ltr in valids:
+            masks.append(letters_to_mask(valids[ltr]))
+        else:
+            masks.append(_UNCONSTRAINED)
+    return masks
 
-    new_sz = filter_size(decryption_possibilities)
-    old_sz = new_sz + 1
 
-    while new_sz < old_sz:
-        old_sz = new_sz
+def masks_to_possibles(masks: list) -> dict:
+    """
+    Convert a list of 26 bit masks back into a possible decryption values
+    dictionary.  Unconstrained letters are left out of the dictionary.
+
+    param masks: list of masks indexed by cipher letter
+    return: the dictionary of possible decryption values
+    """
+    valids = {}
+    for ltr, mask in zip(string.ascii_lowercase, masks):
+        if not mask & _UNKNOWN:
+            valids[ltr] = mask_to_letters(mask)
+    return valids
 
-        decryption_possibilities = clean_known(decryption_possibilities)
-        for word in words:
-            decryption_possibilities = prune(word, decryption_possibilities)
 
-        new_sz = filter_size(decryption_possibilities)
+def clean_known_masks(masks: list) -> list:
+    """
+    Remove any letters that are completely solved from all other
+    possibles.  Works on (and updates) a list of bit masks.
 
-    return build_answer(gram, decryption_possibilities)
+    param masks: list of masks indexed by cipher letter
+    return: the updated list of masks
+    """
+    _narrow_known(masks)
+    return masks
 
 
-def grade_solution(result: str) -> (int, int):
+def _narrow_known(masks: list) -> int:
     """
-    Grade the cryptogram solution. A grade has two parts:
-        Part 1 = the sum of the number of possible choices for all letters
-                    that have more than 1 potential value.
-        Part 2 = the number of valid english words found in the answer
+    Remove solved letters from all other letters' masks (see
+    clean_known_masks).
 
-    param result: the cryptogram solution to be graded
-    return: The grade for the solution (see fn description).
+    param masks: list of masks indexed by cipher letter (updated)
+    return: bit mask of the cipher letters whose masks changed
     """
-    # Check for unknown values
-    cnt_mode = False
-    ttl_cnt, crt_cnt = 0, 0
+    known = 0
+    for mask in masks:
+        if 1 == mask.bit_count():
+            known |= mask
 
-    for ltr in result:
-        if cnt_mode:
-            if ']' == ltr:
-                cnt_mode = False
-                ttl_cnt += crt_cnt
-            else:
-                if ltr.isdigit():
-                    crt_cnt *= 10
-                    crt_cnt += int(ltr)
-                else:
-                    crt_cnt += 1
-        else:
-            if '*' == ltr:
-                crt_cnt += 26
-            elif '[' == ltr:
-                cnt_mode = True
-                crt_cnt = 0
+    changed = 0
+    if known:
+        for idx, mask in enumerate(masks):
+            if mask & known and not mask & _UNKNOWN and 1 != mask.bit_count():
+                masks[idx] = mask & ~known
+                changed |= 1 << idx
 
-    # check for english words.
+    return changed
 
-    wrd_cnt = 0
-    words = result.lower().translate(str.maketrans('', '', string.punctuation)).split()
-    for word in words:
-        if is_english_word(word):
-            wrd_cnt += 1
 
-    # first value is # of possibilities not decrypted.
-    # second value is the number of valid english words found
-    return ttl_cnt, wrd_cnt
+def _match_template_bits(index: (int, tuple), allowed: tuple) -> tuple:
+    """
+    Find the letters used by the template's words that only use allowed
+    letters (see Dictionary._match_template), with the template's inverted
+    index.
+
+    param index: the template's bitsets (see Dictionary.template_bits)
+    param allowed: allowed letter mask for each different template letter
+    return: tuple of the masks of letters found for each different letter
+            in the template (all 0 if no word fits).
+    """
+    fits, letter_bits = index
+    fits = _filter_candidates(letter_bits, fits, allowed)
+    if not fits:
+        return (0,) * len(allowed)
+    return _candidate_letters(letter_bits, fits, allowed)
 
 
-def is_better(score1: (int, int), score2: (int, int)):
+def _filter_candidates(letter_bits: tuple, fits: int, allowed: tuple) -> int:
     """
-    Compare the grades (see grade_grade_solution) of two solutions.
-    Note: a solution has 2 parts.
-            Part 1 = number of choices for unknown letters.
-            Part 2 = number of valid english words found.
+    Keep the words of a template that only use allowed letters.
 
-    param score1: the score of the first solution
-    param score2: the score of the second solution
-    return: True if the first solition is a better solution, False if the
-                second solution is better (or if the solutions received
-                the same grade).
+    param letter_bits: the template's letter bitsets (see
+                       Dictionary.template_bits)
+    param fits: bitset of the words to choose from
+    param allowed: allowed letter mask for each different template letter
+    return: bitset of the words of fits that only use allowed letters
     """
-    if score1[1] == score2[1]:
-        return score1[0] < score2[0]
-    return score1[1] > score2[1]
+    for mask, bits in zip(allowed, letter_bits):
+        if _ALL_LETTERS == mask:
+            continue
+        if mask.bit_count() <= len(bits) // 2:
+            selected = 0
+            for ltr_no, words in enumerate(bits):
+                if mask >> ltr_no & 1:
+                    selected |= words
+            fits &= selected
+        else:
+            for ltr_no, words in enumerate(bits):
+                if not mask >> ltr_no & 1:
+                    fits &= ~words
+        if not fits:
+            break
+    return fits
 
 
-def all_letter_pairs(phrase: str) -> list:
+def _candidate_letters(letter_bits: tuple, fits: int, allowed: tuple) -> tuple:
     """
-    Get a list of all letter pairs in the supplied phrase.
-
-    param phrase: Cryptogram phrase
-    return: A list of all contiguous letters in the phrase.  Contiguous letters
-            must be in the same word. Duplicates are intentionally NOT REMOVED.
+    Find the letters a set of words of a template use.
+
+    param letter_bits: the template's letter bitsets (see
+                       Dictionary.template_bits)
+    param fits: bitset of the words
+    param allowed: allowed letter mask for each different template letter
+                   (only these letters are looked for)
+    return: tuple of the masks of letters found for each different letter
+            in the template
     """
-    all_pairs = []
-    words = phrase.split()
-    for word in words:
-        for idx in range(len(word)-2):
-            if word[idx] in string.ascii_lowercase and word[idx+1] in string.ascii_lowercase:
-                ltr_pair = word[idx:idx+2]
-                all_pairs.append(ltr_pair)
+    found = []
+    for mask, bits in zip(allowed, letter_bits):
+        letters = 0
+        for ltr_no, words in enumerate(bits):
+            if mask >> ltr_no & 1 and words & fits:
+                letters |= 1 << ltr_no
+        found.append(letters)
+    return tuple(found)
 
-    return all_pairs
 
+def prune_masks(word: str, masks: list, dictionary: Dictionary = None) -> list:
+    """
+    Remove any values from the list of bit masks that are not possible for
+    the supplied (encrypted, lowercase) word.  A letter with an empty mask
+    places no restriction on matching words.  Words with characters other
+    than a-z are skipped.
 
-def most_common_letter_pairs(gram: str, count: int = 5) -> list:
+    param word: the encrypted word
+    param masks: list of masks indexed by cipher letter
+    param dictionary: the words to use (default_dictionary() if None)
+    return: the updated list of masks
     """
-    Find the most common pairs of contiguous letters in the cryptogram.
+    dictionary = dictionary or default_dictionary()
+    _narrow_word(word, masks, dictionary, dictionary.tiers - 1)
+    return masks
 
-    param gram: Phrase to parse for the letter pairs.
-    param count: The number of letter pairs desired.
-    return: Up to the first <count> pairs of letters that occur the most times
-            in the phrase.  NOTE: Double letters are always returned even if
-            the list exceeds <count>.
+
+def _narrow_word(word: str, masks: list, dictionary: Dictionary, first_tier: int = 0) -> int:
     """
-    mc_pairs = []
-    all_pairs = all_letter_pairs(gram)
+    Remove values that are not possible for the word (see prune_masks).
+    Only the most common words that fit are used: the dictionary's tiers
+    are tried in order from first_tier until some word fits.  Masks only
+    ever shrink, so a tier that no word fits never becomes useful again,
+    and starting from the first tier every time gives the same result as
+    remembering how far each word was widened.
 
-    counts = Counter(all_pairs)
-    srt_quan = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+    param word: the encrypted word
+    param masks: list of masks indexed by cipher letter (updated)
+    param dictionary: the words to use
+    param first_tier: the first word tier to try
+    return: bit mask of the cipher letters whose masks changed
+    """
+    _STATS["prune"] += 1
+    tmpl, cipher_idx = _word_letters(word)
+    bucket = dictionary.templates.get(tmpl)
+    if bucket is None:
+        return 0
+
+    allowed = tuple((masks[idx] & _ALL_LETTERS) or _ALL_LETTERS for idx in cipher_idx)
+    tiers = bucket.tiers
+    for tier in range(min(first_tier, len(tiers) - 1), len(tiers)):
+        # a tier with no more words than the next one is tried as that one
+        if tier + 1 < len(tiers) and tiers[tier] == tiers[tier + 1]:
+            continue
+        found = dictionary.match_template(tmpl, allowed, tier)
+        if found[0]:
+            break
 
-    for idx, pair in enumerate(srt_quan):
-        if idx < count or pair[0][0] == pair[0][1]:
-            mc_pairs.append(pair[0])
+    # No match survived, nothing can be learned.
+    changed = 0
+    if found[0]:
+        for idx, letters in zip(cipher_idx, found):
+            if masks[idx] & ~letters:
+                masks[idx] &= letters
+                changed |= 1 << idx
 
-    return mc_pairs
+    return changed
 
 
-def one_letter_words(phrase: str) -> set:
+@functools.lru_cache(maxsize=_PRUNE_CACHE_SIZE)
+def _word_letters(word: str) -> (str, tuple):
     """
-    Find the set of one letter words in this phrase
+    Get the template of an encrypted word and its different letters.
 
-    param phrase: the cryptogram to search through for single letter words
-    return: a set of the one character words in the phrase.
+    param word: the encrypted (lowercase) word
+    return: tuple of the word's template (None if the word has characters
+            other than a-z) and the numbers (a=0 .. z=25) of its different
+            letters in order of first use.
     """
-    results = set()
-    for word in phrase.split():
-        if len(word) == 1:
-            results.add(word)
-
-    return results
+    if not all(ltr in _LETTER_BITS for ltr in word):
+        return None, ()
+    return word_template(word), tuple(ord(ltr) - ord('a') for ltr in dict.fromkeys(word))
 
 
-def most_used_letters(gram: str, count: int = 5) -> list:
+def prune_cache_info(dictionary: Dictionary = None):
     """
-    Return the <count> most common letters in <gram>.
+    Get the hit and miss counts of a dictionary's template match cache used
+    by prune_masks (and prune, solve_cryptogram, ...).
 
-    param gram: cryptogram to check letter frequency for.
-    param count: the number of letters to return
-    return: sorted list of most common letters in <gram> starting with
-                the most frequently used letter.
+    param dictionary: the dictionary (default_dictionary() if None)
+    return: functools cache info named tuple (hits, misses, maxsize, currsize)
     """
-    counts = Counter(gram.lower())
-    freqs = []
+    return (dictionary or default_dictionary()).match_template.cache_info()
 
-    srt_quan = sorted((counts.items()), key=lambda item: item[1], reverse=True)
+
+def propagate_masks(words: list, masks: list, dictionary: Dictionary = None,
+                    changed: int = None) -> list:
+    """
+    Prune the masks with every word until nothing more can be removed.
+
+    Works in rounds like the original full sweeps (solved letters are
+    cleaned out of the others, then the words are pruned in order) and stops
+    the same way, when a round no longer shrinks filter_size_masks.  Unlike
+    a full sweep, a word is only pruned again once the mask of one of its
+    letters has changed since it was last pruned (by another word or by
+    the cleaning), AC-3 style.  Pruning a word whose letters have not
+    changed can not change anything, so the result is the same as always
+    pruning every word.
+
+    Repeated words are only tracked once; a repeat is pruned in its place
+    in the text only if the word has changed since it was last pruned.
+
+    When the masks were already propagated and then only a few letters
+    were narrowed (a hint added, a search choice made), pass those letters
+    as changed so only the words using them are pruned at first.
+
+    With a tiered dictionary each word is pruned with its most common
+    fitting words (see _narrow_word).  If that leads to a contradiction
+    the masks are propagated again from the start with all the words.
+
+    Once pruning words one at a time changes nothing more, a full
+    propagation (changed None) filters the words that share two or more
+    letters jointly (see _WordCandidates) and, if that narrowed any letter,
+    prunes the words using it again, and so on until neither changes
+    anything.  If that ends in a contradiction, the masks as pruning single
+    words left them are kept.
+
+    param words: the encrypted (lowercase) words
+    param masks: list of masks indexed by cipher letter (updated)
+    param dictionary: the words to use (default_dictionary() if None)
+    param changed: bit mask of the cipher letters changed since the masks
+                   were last propagated (None if they never were)
+    return: the updated list of masks
+    """
+    dictionary = dictionary or default_dictionary()
+    unique_words, text_order, words_using = _word_uses(tuple(words))
+
+    def mark_dirty(changed: int, skip: int = -1) -> None:
+        while changed:
+            idx = changed.bit_length() - 1
+            changed ^= 1 << idx
+            for user in words_using[idx]:
+                if user != skip:
+                    dirty[user] = True
+
+    profile = _PROFILE
+    last_tier = dictionary.tiers - 1
+    start = list(masks) if last_tier else None
+    first_tier = 0
+    while True:
+        dirty = [changed is None] * len(unique_words)
+        if changed is not None:
+            mark_dirty(changed)
+        _propagate_rounds(text_order, masks, dictionary, first_tier, dirty, mark_dirty)
+
+        # Joint filtering costs far more than pruning single words, and
+        # continuing from masks that were filtered jointly before (changed
+        # given, as for hints) gains little from it, so only full
+        # propagations do it.
+        links = _word_links(unique_words, dictionary) if changed is None else None
+        if links and links[1] and _is_consistent(masks):
+            single = list(masks)
+            candidates = _WordCandidates(links, first_tier)
+            while _is_consistent(masks):
+                if profile is None:
+                    narrowed = candidates.filter(masks)
+                else:
+                    narrowed = profile.call("joint filter", candidates.filter, masks)
+                if not narrowed:
+                    break
+                dirty = [False] * len(unique_words)
+                mark_dirty(narrowed)
+                _propagate_rounds(text_order, masks, dictionary, first_tier, dirty, mark_dirty)
+            if not _is_consistent(masks):
+                # some word is not in the dictionary; filtering jointly
+                # with its wrong candidates ruled out the right letters
+                if profile is not None:
+                    profile.count("joint fallbacks")
+                masks[:] = single
+
+        if first_tier == last_tier or _is_consistent(masks):
+            return masks
+        if profile is not None:
+            profile.count("tier fallbacks")
+        masks[:] = start
+        first_tier = last_tier
+
+
+def _propagate_rounds(text_order: list, masks: list, dictionary: Dictionary,
+                      first_tier: int, dirty: list, mark_dirty) -> None:
+    """
+    Prune the dirty words until nothing more can be removed (see
+    propagate_masks).
+
+    param text_order: (unique word number, word) for each word in the text
+    param masks: list of masks indexed by cipher letter (updated)
+    param dictionary: the words to use
+    param first_tier: the first word tier to try for each word
+    param dirty: flag for each unique word that needs pruning (updated)
+    param mark_dirty: function marking the words using changed letters
+    """
+    new_sz = filter_size_masks(masks)
+    old_sz = new_sz + 1
+    profile = _PROFILE
+
+    while new_sz < old_sz:
+        old_sz = new_sz
+
+        if profile is None:
+            mark_dirty(_narrow_known(masks))
+        else:
+            mark_dirty(profile.call("clean known", _narrow_known, masks))
+
+        for word_no, word in text_order:
+            if dirty[word_no]:
+                dirty[word_no] = False
+                # pruning a word twice in a row never changes anything
+                if profile is None:
+                    mark_dirty(_narrow_word(word, masks, dictionary, first_tier), word_no)
+                else:
+                    mark_dirty(profile.call("prune", _narrow_word, word, masks, dictionary,
+                                            first_tier), word_no)
+
+        new_sz = filter_size_masks(masks)
+        if profile is not None:
+            profile.count("propagation rounds")
+            profile.domain_sizes.append(new_sz)
+
+
+@functools.lru_cache(maxsize=1024)
+def _word_uses(words: tuple) -> (tuple, tuple, tuple):
+    """
+    Work out which words propagate_masks prunes, in what order, and which
+    of them each letter narrows.  Cached, since a cryptogram's words are
+    propagated again for every hint and search choice.
+
+    param words: the encrypted (lowercase) words
+    return: tuple of the different words, the (unique word number, word)
+            for each word in the text, and for each cipher letter the
+            numbers of the unique words containing it.
+    """
+    unique_words = tuple(dict.fromkeys(words))
+    word_numbers = {word: word_no for word_no, word in enumerate(unique_words)}
+    text_order = tuple((word_numbers[word], word) for word in words)
+
+    # words_using[n] lists the (unique) words containing the n-th cipher letter
+    words_using = [[] for _ in string.ascii_lowercase]
+    for word_no, word in enumerate(unique_words):
+        for ltr in set(word):
+            if ltr in _LETTER_BITS:
+                words_using[ord(ltr) - ord('a')].append(word_no)
+
+    return unique_words, text_order, tuple(tuple(users) for users in words_using)
+
+
+class SolverState:
+    """
+    The letter masks of a cryptogram being solved, changed in place.  Each
+    change is written to a trail first, so trying a hypothesis (a hint, a
+    search choice) is: mark the trail, narrow some letters, propagate, look
+    at the masks, and undo back to the mark, in time proportional to the
+    number of letters that changed rather than copying the masks for each
+    hypothesis.
+    """
+    __slots__ = ("words", "dictionary", "masks", "_trail")
+
+    def __init__(self, words: list, masks: list = None, dictionary: Dictionary = None):
+        """
+        param words: the encrypted (lowercase) words
+        param masks: list of masks indexed by cipher letter to start from
+                     (copied, every letter unconstrained if None)
+        param dictionary: the words to use (default_dictionary() if None)
+        """
+        self.words = tuple(words)
+        self.dictionary = dictionary or default_dictionary()
+        self.masks = [_UNCONSTRAINED] * len(_LETTER_BITS) if masks is None else list(masks)
+        # each entry is a letter's mask before a change, shifted left 5
+        # bits, or'ed with the letter's index
+        self._trail = array.array('Q')
+
+    def mark(self) -> int:
+        """
+        return: the point on the trail to undo back to (see undo)
+        """
+        return len(self._trail)
+
+    def assign(self, idx: int, mask: int) -> None:
+        """
+        Change the mask of a cipher letter.
+
+        param idx: index of the cipher letter
+        param mask: its new mask
+        """
+        old = self.masks[idx]
+        if old != mask:
+            self._trail.append(old << 5 | idx)
+            self.masks[idx] = mask
+
+    def propagate(self, changed: int = None) -> bool:
+        """
+        Propagate the masks (see propagate_masks).
+
+        param changed: bit mask of the cipher letters assigned since the
+                       masks were last propagated (None if they never were)
+        return: True if the masks are still consistent (see _is_consistent)
+        """
+        masks = self.masks
+        before = list(masks)
+        propagate_masks(self.words, masks, self.dictionary, changed)
+
+        trail = self._trail
+        for idx, old in enumerate(before):
+            if old != masks[idx]:
+                trail.append(old << 5 | idx)
+        return _is_consistent(masks)
+
+    def undo(self, mark: int = 0) -> None:
+        """
+        Put the masks back the way they were.
+
+        param mark: the point on the trail to go back to (see mark), 0 for
+                    the masks the state started with
+        """
+        masks, trail = self.masks, self._trail
+        while len(trail) > mark:
+            entry = trail.pop()
+            masks[entry & 0x1f] = entry >> 5
+
+
+@functools.lru_cache(maxsize=1024)
+def _selectivity_order(unique_words: tuple, dictionary: Dictionary) -> tuple:
+    """
+    Order the words of a cryptogram from the most to the least selective:
+    fewest dictionary words of their template first, then most repeated
+    letters (their pattern says more), then in text order.  Words no
+    dictionary word matches come last.
+
+    param unique_words: the different encrypted (lowercase) words
+    param dictionary: the words to use
+    return: tuple of the word numbers, most selective first
+    """
+    def selectivity(word_no: int) -> (float, int, int):
+        word = unique_words[word_no]
+        bucket = dictionary.templates.get(_word_letters(word)[0])
+        matches = math.inf if bucket is None else len(bucket)
+        return matches, len(set(word)) - len(word), word_no
+
+    return tuple(sorted(range(len(unique_words)), key=selectivity))
+
+
+@functools.lru_cache(maxsize=1024)
+def _word_links(unique_words: tuple, dictionary: Dictionary) -> (list, list):
+    """
+    Find the words of a cryptogram that share two or more different
+    letters (see _WordCandidates).  Words sharing a single letter are
+    already kept consistent by that letter's mask.
+
+    param unique_words: the different encrypted (lowercase) words
+    param dictionary: the words to use
+    return: tuple of, for each word, None if no dictionary word has its
+            template or a tuple of its cipher letters (see _word_letters),
+            its template's bitsets and its bucket's tier sizes; and the
+            list of (word number, word number, ((letter number in the
+            first word, letter number in the second), ...)) links.
+    """
+    words = []
+    for word in unique_words:
+        tmpl, cipher_idx = _word_letters(word)
+        bucket = dictionary.templates.get(tmpl)
+        if bucket is None:
+            words.append(None)
+        else:
+            alpha, letter_bits = dictionary.template_bits(tmpl)
+            words.append((cipher_idx, alpha, letter_bits, bucket.tiers))
+
+    links = []
+    for first, second in itertools.combinations(range(len(words)), 2):
+        if words[first] is not None and words[second] is not None:
+            positions = {idx: pos for pos, idx in enumerate(words[second][0])}
+            shared = tuple((pos, positions[idx]) for pos, idx in enumerate(words[first][0])
+                           if idx in positions)
+            if len(shared) > 1:
+                links.append((first, second, shared))
+    return words, links
+
+
+class _WordCandidates:
+    """
+    The dictionary words each cipher word can still be, kept as a bitset of
+    its template's words over the rounds of one propagation (see
+    propagate_masks).  Pruning one word at a time only passes single
+    letters between words, so two words sharing two letters can keep
+    candidates that no candidate of the other agrees with on both.  The
+    joint filter removes those (AC-3 over the linked pairs), then narrows
+    the letter masks to the letters the remaining candidates use.
+
+    A word whose candidates all go is widened to the next word tier (see
+    _narrow_word); with no tier left it no longer constrains anything, as
+    a word with no dictionary match does not when pruned on its own.
+    """
+    __slots__ = ("words", "links", "word_links", "cands", "tiers")
+
+    def __init__(self, links: (list, list), first_tier: int):
+        """
+        param links: the cryptogram's words and links (see _word_links)
+        param first_tier: the first word tier to use for each word
+        """
+        self.words, self.links = links
+        # link numbers of each word
+        self.word_links = [[] for _ in self.words]
+        for link_no, (first, second, _) in enumerate(self.links):
+            self.word_links[first].append(link_no)
+            self.word_links[second].append(link_no)
+        # tier and candidate bitset of each word (None once it has no candidates)
+        self.tiers = [first_tier - 1] * len(self.words)
+        self.cands = [None] * len(self.words)
+        for word_no, word in enumerate(self.words):
+            if word is not None:
+                self.cands[word_no] = 0
+
+    def _widen(self, word_no: int, masks: list) -> None:
+        """
+        Restart a word's candidates from its next word tier that any word
+        fits.
+
+        param word_no: the word number
+        param masks: list of masks indexed by cipher letter
+        """
+        cipher_idx, alpha, letter_bits, tiers = self.words[word_no]
+        allowed = tuple((masks[idx] & _ALL_LETTERS) or _ALL_LETTERS for idx in cipher_idx)
+        cands = 0
+        tier = self.tiers[word_no] + 1
+        while not cands and tier < len(tiers):
+            tier = max(tier, 0)
+            cands = _filter_candidates(letter_bits, alpha & ((1 << tiers[tier]) - 1), allowed)
+            tier += 1
+        self.tiers[word_no] = tier - 1
+        self.cands[word_no] = cands or None
+
+    def _revise(self, link: tuple, masks: list) -> (int, int):
+        """
+        Keep the candidates of two linked words that agree on their shared
+        letters with some candidate of the other word.
+
+        param link: the link (see _word_links)
+        param masks: list of masks indexed by cipher letter
+        return: tuple of the candidates kept for each word
+        """
+        first, second, shared = link
+        cipher_idx = self.words[first][0]
+        levels = [(self.words[first][2][first_pos], self.words[second][2][second_pos],
+                   (masks[cipher_idx[first_pos]] & _ALL_LETTERS) or _ALL_LETTERS)
+                  for first_pos, second_pos in shared]
+        last = len(levels) - 1
+        kept_first = kept_second = 0
+
+        def agree(first_cands: int, second_cands: int, depth: int) -> None:
+            nonlocal kept_first, kept_second
+            first_bits, second_bits, letters = levels[depth]
+            while letters:
+                ltr_no = (letters & -letters).bit_length() - 1
+                letters &= letters - 1
+                both_first = first_cands & first_bits[ltr_no]
+                if both_first:
+                    both_second = second_cands & second_bits[ltr_no]
+                    if both_second:
+                        if depth == last:
+                            kept_first |= both_first
+                            kept_second |= both_second
+                        else:
+                            agree(both_first, both_second, depth + 1)
+
+        agree(self.cands[first], self.cands[second], 0)
+        return kept_first, kept_second
+
+    def filter(self, masks: list) -> int:
+        """
+        Filter the candidates with the masks and jointly, and narrow the
+        masks with them.
+
+        param masks: list of masks indexed by cipher letter (updated)
+        return: bit mask of the cipher letters whose masks changed
+        """
+        # only the links of words whose candidates changed need revising
+        queued = [False] * len(self.links)
+        queue = deque()
+
+        def requeue(word_no: int) -> None:
+            for link_no in self.word_links[word_no]:
+                if not queued[link_no]:
+                    queued[link_no] = True
+                    queue.append(link_no)
+
+        for word_no, word in enumerate(self.words):
+            cands = self.cands[word_no]
+            if cands is None:
+                continue
+            if self.tiers[word_no] < 0 or not cands:
+                self._widen(word_no, masks)
+            else:
+                cipher_idx, _, letter_bits, _ = word
+                allowed = tuple((masks[idx] & _ALL_LETTERS) or _ALL_LETTERS
+                                for idx in cipher_idx)
+                self.cands[word_no] = _filter_candidates(letter_bits, cands, allowed)
+                if not self.cands[word_no]:
+                    self._widen(word_no, masks)
+            if self.cands[word_no] != cands:
+                requeue(word_no)
+
+        while queue:
+            link_no = queue.popleft()
+            queued[link_no] = False
+            link = self.links[link_no]
+            if self.cands[link[0]] is None or self.cands[link[1]] is None:
+                continue
+
+            for word_no, kept in zip(link[:2], self._revise(link, masks)):
+                if kept == self.cands[word_no]:
+                    continue
+                if _PROFILE is not None:
+                    _PROFILE.count("joint candidates removed",
+                                   (self.cands[word_no] & ~kept).bit_count())
+                self.cands[word_no] = kept
+                if not kept:
+                    self._widen(word_no, masks)
+                requeue(word_no)
+
+        changed = 0
+        for word_no, word in enumerate(self.words):
+            if self.cands[word_no]:
+                cipher_idx, _, letter_bits, _ = word
+                allowed = tuple((masks[idx] & _ALL_LETTERS) or _ALL_LETTERS
+                                for idx in cipher_idx)
+                found = _candidate_letters(letter_bits, self.cands[word_no], allowed)
+                for idx, letters in zip(cipher_idx, found):
+                    if masks[idx] & ~letters:
+                        masks[idx] &= letters
+                        changed |= 1 << idx
+        return changed
+
+
+def solver_stats() -> dict:
+    """
+    Get the running totals of solver work done in this process.
+    'prune' is the number of times a word was pruned, 'hint runs' the
+    number of hints find_best_solution_with_hints solved and 'hints cut
+    short' the number it skipped because they could not beat the best
+    solution so far.
+
+    return: dictionary of counter name to count
+    """
+    return dict(_STATS)
+
+
+def reset_solver_stats() -> None:
+    """
+    Set the running totals of solver work (see solver_stats) back to zero.
+    """
+    _STATS.clear()
+
+
+class Profile:
+    """
+    Timers and counters for the phases of solving, filled in while
+    profiling is enabled (see enable_profiling).  Phases can be nested
+    (e.g. 'prune' time is part of 'hints' time).
+
+    Only work done in this process is recorded, solve with one worker to
+    profile everything.
+    """
+
+    def __init__(self):
+        self.seconds = Counter()        # phase name -> total seconds
+        self.calls = Counter()          # phase name -> times the phase ran
+        self.counts = Counter()         # counter name -> count
+        self.domain_sizes = []          # filter size after each propagation round
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        """
+        Record one run of a phase.
+
+        param phase: name of the phase
+        param seconds: time the phase took
+        """
+        self.seconds[phase] += seconds
+        self.calls[phase] += 1
+
+    @contextlib.contextmanager
+    def phase(self, phase: str):
+        """
+        Context manager timing the code inside it as a phase.
+
+        param phase: name of the phase
+        """
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def call(self, phase: str, func, *args):
+        """
+        Call a function, timing it as a phase.  Cheaper than phase() for
+        small, frequently called functions.
+
+        param phase: name of the phase
+        param func: the function to call
+        param args: the function's arguments
+        return: the function's return value
+        """
+        start = time.perf_counter()
+        result = func(*args)
+        self.seconds[phase] += time.perf_counter() - start
+        self.calls[phase] += 1
+        return result
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """
+        Add to a counter.
+
+        param name: name of the counter
+        param amount: amount to add
+        """
+        self.counts[name] += amount
+
+    def as_dict(self) -> dict:
+        """
+        return: the profile as a dictionary (for JSON, etc.)
+        """
+        return {"phases": {phase: {"calls": self.calls[phase],
+                                   "seconds": round(self.seconds[phase], 6)}
+                           for phase in self.seconds},
+                "counts": dict(self.counts),
+                "domain_sizes": list(self.domain_sizes)}
+
+    def report(self) -> str:
+        """
+        return: the profile as a printable table
+        """
+        lines = [f"     {'phase':24}{'calls':>10}{'seconds':>12}"]
+        for phase, seconds in self.seconds.most_common():
+            lines.append(f"     {phase:24}{self.calls[phase]:10}{seconds:12.4f}")
+
+        lines.append("")
+        lines.append(f"     {'counter':24}{'count':>10}")
+        for name, count in sorted(self.counts.items()):
+            lines.append(f"     {name:24}{count:10}")
+
+        if self.domain_sizes:
+            lines.append("")
+            lines.append(f"     domain size after each round: {self.domain_sizes[:40]}"
+                         + (" ..." if len(self.domain_sizes) > 40 else ""))
+
+        return '\n'.join(lines)
+
+
+def enable_profiling() -> Profile:
+    """
+    Start recording phase timers and counters (see Profile).  While
+    profiling is disabled (the default) the solver does not measure
+    anything beyond solver_stats.
+
+    return: the new profile, filled in as solving goes on
+    """
+    # a module global, not a holder object: the solver's hot paths check
+    # it with one global lookup when profiling is off
+    global _PROFILE     # pylint: disable=global-statement
+    _PROFILE = Profile()
+    return _PROFILE
+
+
+def disable_profiling() -> Profile:
+    """
+    Stop recording phase timers and counters.
+
+    return: the finished profile (None if profiling was not enabled)
+    """
+    global _PROFILE     # pylint: disable=global-statement
+    profile, _PROFILE = _PROFILE, None
+    return profile
+
+
+def filter_size_masks(masks: list) -> int:
+    """
+    Determine the "size" of a list of bit masks (see filter_size).
+
+    param masks: list of masks indexed by cipher letter
+    return: the sum of the number of possible decryption letters for each
+            letter in the alphabet.
+    """
+    sze = 0
+    for mask in masks:
+        sze += (mask & _ALL_LETTERS).bit_count() or len(string.ascii_lowercase)
+    return sze
+
+
+def print_possibles(dct: dict) -> None:
+    """
+    Print the possible values dictionary in a compact way.  For debugging
+
+    param dct: the possible values dictionary
+    """
+    if _DEBUG:
+        print('     ', end='')
+        for key, val in dct.items():
+            print(key.upper(), end=':')
+            for ltr in sorted(val):
+                print(ltr, end='')
+            print(',  ', end='')
+
+        print()
+
+
+def cipher_words(gram: str) -> list:
+    """
+    Split a cryptogram into its words, lowercase and without punctuation.
+
+    param gram: The cryptogram
+    return: list of the words in the cryptogram
+    """
+    return gram.lower().translate(str.maketrans('', '', string.punctuation)).split()
+
+
+@functools.lru_cache(maxsize=256)
+def _gram_words(gram: str) -> (tuple, tuple):
+    """
+    Get the words of a cryptogram with the letters each one uses, and how
+    many times each letter is used.  Cached since every hint scores the same
+    cryptogram.
+
+    param gram: The cryptogram
+    return: tuple of (word, mask of its cipher letters) tuples, and tuple of
+            the number of uses of each cipher letter
+    """
+    words = tuple((word, letters_to_mask(ltr for ltr in word if ltr in _LETTER_BITS))
+                  for word in cipher_words(gram))
+    uses = Counter(gram.lower())
+    return words, tuple(uses[ltr] for ltr in string.ascii_lowercase)
+
+
+class Solution:
+    """
+    The result of solving a cryptogram: the possible values left for each
+    cipher letter, each word's decryption (once all of its letters are
+    known) and the score (see grade_solution), worked out from the letter
+    masks rather than from the answer text.  The answer text is only built
+    when asked for (str(solution) or solution.text).
+    """
+
+    def __init__(self, gram: str, masks: list, dictionary: Dictionary = None):
+        """
+        param gram: The original cryptogram
+        param masks: list of masks indexed by cipher letter (see propagate_masks)
+        param dictionary: the words to score with (default_dictionary() if None)
+        """
+        dictionary = dictionary or default_dictionary()
+        self.gram = gram
+        self.masks = masks
+        self._text = None
+
+        # cipher letter -> English letter for the letters that are solved
+        solved, key = 0, {}
+        for idx, mask in enumerate(masks):
+            if 1 == mask.bit_count():
+                solved |= 1 << idx
+                key[ord('a') + idx] = chr(ord('a') + mask.bit_length() - 1)
+
+        # list of (cipher word, English word or None while unsolved) tuples
+        gram_words, uses = _gram_words(gram)
+        self.words = [(word, word.translate(key) if letters & ~solved == 0 else None)
+                      for word, letters in gram_words]
+
+        unsolved = sum(count * mask.bit_count()
+                       for count, mask in zip(uses, masks)
+                       if count and not mask & _UNKNOWN and mask.bit_count() > 1)
+        english = sum(1 for _, plain in self.words
+                      if plain is not None and plain in dictionary.words)
+        self.score = (unsolved, english)
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __repr__(self) -> str:
+        return f"Solution({self.text!r}, score={self.score})"
+
+    @property
+    def text(self) -> str:
+        """ the answer with unsolved letters shown in brackets (see build_answer) """
+        if self._text is None:
+            self._text = build_answer(self.gram, masks_to_possibles(self.masks))
+        return self._text
+
+
+def solve(gram: str, valids: dict = None, dictionary: Dictionary = None) -> Solution:
+    """
+    Given a cryptogram, attempt to solve it.
+
+    param gram: The original cryptogram
+    param valids: the starting selection of valid letters (hints)
+    param dictionary: the words to use (default_dictionary() if None)
+    return: The (near) answer as a Solution
+    """
+    decryption_masks = propagate_masks(cipher_words(gram), possibles_to_masks(valids or {}),
+                                       dictionary)
+    return Solution(gram, decryption_masks, dictionary)
+
+
+def solve_cryptogram(gram: str, valids: dict, dictionary: Dictionary = None) -> str:
+    """
+    Given a cryptogram, attempt to solve it.
+
+    param gram: The original cryptogram
+    param dictionary: the words to use (default_dictionary() if None)
+    return: The answer or near answer as a string
+    """
+    decryption_masks = propagate_masks(cipher_words(gram), possibles_to_masks(valids),
+                                       dictionary)
+
+    return build_answer(gram, masks_to_possibles(decryption_masks))
+
+
+def grade_solution(result: str, dictionary: Dictionary = None) -> (int, int):
+    """
+    Grade the cryptogram solution. A grade has two parts:
+        Part 1 = the sum of the number of possible choices for all letters
+                    that have more than 1 potential value.
+        Part 2 = the number of valid english words found in the answer
+
+    Solution.score is the same grade worked out from the letter masks,
+    without parsing the answer text.
+
+    param result: the cryptogram solution to be graded
+    param dictionary: the words to use (default_dictionary() if None)
+    return: The grade for the solution (see fn description).
+    """
+    # Check for unknown values
+    cnt_mode = False
+    ttl_cnt, crt_cnt = 0, 0
+
+    for ltr in result:
+        if cnt_mode:
+            if ']' == ltr:
+                cnt_mode = False
+                ttl_cnt += crt_cnt
+            else:
+                if ltr.isdigit():
+                    crt_cnt *= 10
+                    crt_cnt += int(ltr)
+                else:
+                    crt_cnt += 1
+        else:
+            if '*' == ltr:
+                crt_cnt += 26
+            elif '[' == ltr:
+                cnt_mode = True
+                crt_cnt = 0
+
+    # check for english words.
+
+    wrd_cnt = 0
+    words = result.lower().translate(str.maketrans('', '', string.punctuation)).split()
+    for word in words:
+        if is_english_word(word, dictionary):
+            wrd_cnt += 1
+
+    # first value is # of possibilities not decrypted.
+    # second value is the number of valid english words found
+    return ttl_cnt, wrd_cnt
+
+
+def is_better(score1: (int, int), score2: (int, int)):
+    """
+    Compare the grades (see grade_grade_solution) of two solutions.
+    Note: a solution has 2 parts.
+            Part 1 = number of choices for unknown letters.
+            Part 2 = number of valid english words found.
+
+    param score1: the score of the first solution
+    param score2: the score of the second solution
+    return: True if the first solition is a better solution, False if the
+                second solution is better (or if the solutions received
+                the same grade).
+    """
+    if score1[1] == score2[1]:
+        return score1[0] < score2[0]
+    return score1[1] > score2[1]
+
+
+def all_letter_pairs(phrase: str) -> list:
+    """
+    Get a list of all letter pairs in the supplied phrase.
+
+    param phrase: Cryptogram phrase
+    return: A list of all contiguous letters in the phrase.  Contiguous letters
+            must be in the same word. Duplicates are intentionally NOT REMOVED.
+    """
+    all_pairs = []
+    words = phrase.split()
+    for word in words:
+        for idx in range(len(word)-2):
+            if word[idx] in string.ascii_lowercase and word[idx+1] in string.ascii_lowercase:
+                ltr_pair = word[idx:idx+2]
+                all_pairs.append(ltr_pair)
+
+    return all_pairs
+
+
+def most_common_letter_pairs(gram: str, count: int = 5) -> list:
+    """
+    Find the most common pairs of contiguous letters in the cryptogram.
+
+    param gram: Phrase to parse for the letter pairs.
+    param count: The number of letter pairs desired.
+    return: Up to the first <count> pairs of letters that occur the most times
+            in the phrase.  NOTE: Double letters are always returned even if
+            the list exceeds <count>.
+    """
+    mc_pairs = []
+    all_pairs = all_letter_pairs(gram)
+
+    counts = Counter(all_pairs)
+    srt_quan = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+
+    for idx, pair in enumerate(srt_quan):
+        if idx < count or pair[0][0] == pair[0][1]:
+            mc_pairs.append(pair[0])
+
+    return mc_pairs
+
+
+def one_letter_words(phrase: str) -> set:
+    """
+    Find the set of one letter words in this phrase
+
+    param phrase: the cryptogram to search through for single letter words
+    return: a set of the one character words in the phrase.
+    """
+    results = set()
+    for word in phrase.split():
+        if len(word) == 1:
+            results.add(word)
+
+    return results
+
+
+def most_used_letters(gram: str, count: int = 5) -> list:
+    """
+    Return the <count> most common letters in <gram>.
+
+    param gram: cryptogram to check letter frequency for.
+    param count: the number of letters to return
+    return: sorted list of most common letters in <gram> starting with
+                the most frequently used letter.
+    """
+    counts = Counter(gram.lower())
+    freqs = []
+
+    srt_quan = sorted((counts.items()), key=lambda item: item[1], reverse=True)
     found = 0
 
-    for ltr, _ in srt_quan:
-        if ltr in string.ascii_lowercase:
-            found += 1
-            if found > count:
-                break
-            freqs.append(ltr)
+    for ltr, _ in srt_quan:
+        if ltr in string.ascii_lowercase:
+            found += 1
+            if found > count:
+                break
+            freqs.append(ltr)
+
+    return freqs
+
+
+def process_pool(workers: int, initializer=None) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Create a pool of worker processes for solving.  Where the platform
+    allows it, workers are forked so they share the dictionaries this
+    process has loaded (copy on write) rather than loading their own copy.
+    Otherwise each worker loads a dictionary from its word index file the
+    first time it needs it, and is sent the words of the word list
+    dictionaries once, when it starts.
+
+    param workers: number of worker processes (None for one per CPU)
+    param initializer: function each worker calls when it starts
+    return: the process pool executor
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+        word_lists = {token: (dictionary._word_source, dictionary.frequency_file or "")
+                      for token, dictionary in _WORD_LISTS.items()}
+        initializer = functools.partial(_start_worker, initializer, word_lists)
+
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                  initializer=initializer)
+
+
+def _start_worker(initializer, word_lists: dict) -> None:
+    """
+    Set up a worker process that was not forked (see process_pool).
+
+    param initializer: function the worker then calls, or None
+    param word_lists: dictionary of word list dictionary name to its words
+                      and frequency file
+    """
+    for token, (words, frequency_file) in word_lists.items():
+        dictionary = Dictionary(words=words, frequency_file=frequency_file)
+        # known by the name the tasks use for it; _WORD_LISTS only holds
+        # it weakly
+        _WORD_LISTS[token] = dictionary
+        _SENT_WORD_LISTS.append(dictionary)
+    if initializer is not None:
+        initializer()
+
+
+def find_best_solution_with_hints(gram: str, hints_lst: list = None,
+                                  workers: int = 1,
+                                  dictionary: Dictionary = None) -> ((int,int),Solution):
+    """
+    Receive a list of hints (Hints are starting valids dictionaries). Solve
+    the cryptogram with each of the hint sets in the list, determine which
+    is best, and return the solution and its associated score.
+
+    Every hint starts from the propagated cryptogram without hints, so a
+    hint only needs the words its letters touch pruned again.  Hints that
+    contradict it are skipped (unless it is contradictory itself, see
+    _hint_start), and hints that start from (or end in) the
+    same letter masks as an earlier hint are only solved (or graded) once.
+
+    Hints may be solved in parallel.  The results are still compared in
+    list order, so the answer is the same as when solving them one by one.
+
+    Hints are only solved while they can still beat the best solution so
+    far: solving only ever narrows a hint's letters, so the words that can
+    still decrypt to English before it is solved (see
+    _possible_english_words) bound its score.  Once some hint ends in a
+    perfect solution (every letter solved, every word English) no hint after
+    it is solved at all; ties go to the earlier hint anyway.
+
+    param gram: Cryptogram to solve
+    param hints_lst: List of dictionaries where each dictionary is the starting
+                     selection of valid letters.
+    param workers: number of processes to solve hints with.  1 solves them
+                   in this process, None uses one process per CPU.
+    param dictionary: the words to use (default_dictionary() if None)
+    return: Tuple of the solution's score and the Solution.
+    """
+    if hints_lst is None:
+        hints_lst = [{}]
+    dictionary = dictionary or default_dictionary()
+
+    if _PROFILE is not None:
+        _PROFILE.count("hints tried", len(hints_lst))
+        with _PROFILE.phase("hints"):
+            return _solve_hints(gram, hints_lst, workers, dictionary)
+    return _solve_hints(gram, hints_lst, workers, dictionary)
+
+
+def _solve_hints(gram: str, hints_lst: list, workers: int,
+                 dictionary: Dictionary) -> ((int, int), Solution):
+    """
+    Solve and grade with each hint, pick the best (see
+    find_best_solution_with_hints).
+
+    param gram: Cryptogram to solve
+    param hints_lst: List of starting valids dictionaries
+    param workers: number of processes to solve hints with
+    param dictionary: the words to use
+    return: Tuple of the solution's score and the Solution.
+    """
+    words = cipher_words(gram)
+    root = _propagate_hint(words, ([_UNCONSTRAINED] * len(_LETTER_BITS), None), dictionary)
+
+    starts, seen = [], set()
+    for hints in hints_lst:
+        start = _hint_start(root, hints)
+        if start is not None and tuple(start[0]) not in seen:
+            seen.add(tuple(start[0]))
+            starts.append(start)
+
+    if _PROFILE is not None:
+        _PROFILE.count("hints skipped", len(hints_lst) - len(starts))
+    if not starts:
+        starts.append((list(root), 0))
+
+    word_counts = Counter(words)
+    best_sco, best_ans = None, None
+
+    def beaten(masks: list) -> bool:
+        """ True if no hint starting from masks can beat the best so far """
+        if best_ans is None:
+            return False
+        possible = _possible_english_words(word_counts, masks, dictionary)
+        return possible < best_sco[1] or (possible == best_sco[1] and 0 == best_sco[0])
+
+    results = _hint_results(words, starts, workers, dictionary, beaten)
+    for sco, ans in _grade_hints(gram, results, dictionary):
+        if (best_ans is None) or (is_better(sco, best_sco)):
+            best_ans = ans
+            best_sco = sco
+
+    return best_sco, best_ans
+
+
+def _hint_results(words: list, starts: list, workers: int, dictionary: Dictionary, beaten):
+    """
+    Generator of the propagated masks of each hint, in order, skipping the
+    hints that can not beat the best solution so far (see
+    find_best_solution_with_hints).
+
+    param words: the encrypted (lowercase) words
+    param starts: list of the masks each hint starts from (see _hint_start)
+    param workers: number of processes to solve hints with
+    param dictionary: the words to use
+    param beaten: function of a hint's starting masks returning True when
+                  the hint need not be solved
+    return: generator of propagated lists of masks
+    """
+    if workers == 1 or len(starts) < 2:
+        for start in starts:
+            if beaten(start[0]):
+                _STATS["hints cut short"] += 1
+            else:
+                _STATS["hint runs"] += 1
+                yield _propagate_hint(words, start, dictionary)
+        return
+
+    # load before forking so the workers share the words
+    dictionary.load()
+    with process_pool(workers) as pool:
+        futures = [pool.submit(_propagate_hint, words, start, dictionary) for start in starts]
+        for future, start in zip(futures, starts):
+            if beaten(start[0]):
+                # too late if a worker already started on it
+                future.cancel()
+                _STATS["hints cut short"] += 1
+            else:
+                _STATS["hint runs"] += 1
+                yield future.result()
+
+
+def _hint_start(root: list, hints: dict) -> (list, int):
+    """
+    Add a hint to the propagated masks of a cryptogram.
+
+    Pruning skips the words no dictionary word fits, so a root that is
+    already contradictory rules nothing out: the hint is then solved from
+    scratch, as if there were no root.
+
+    param root: list of masks indexed by cipher letter, already propagated
+    param hints: the valids dictionary of the hint
+    return: tuple of the new list of masks and the bit mask of the cipher
+            letters the hint narrowed (None to propagate from scratch),
+            None if the hint contradicts root.
+    """
+    if not _is_consistent(root):
+        return possibles_to_masks(hints), None
+
+    masks = list(root)
+    changed = 0
+    for ltr, letters in hints.items():
+        if ltr not in _LETTER_BITS:
+            continue        # as in possibles_to_masks
+        idx = ord(ltr) - ord('a')
+        mask = letters_to_mask(letters)
+        if not masks[idx] & _UNKNOWN:
+            mask &= masks[idx]
+        if mask != masks[idx]:
+            masks[idx] = mask
+            changed |= 1 << idx
+
+    if not _is_consistent(masks):
+        return None
+    return masks, changed
+
+
+def _propagate_hint(words: list, start: (list, int), dictionary: Dictionary) -> list:
+    """
+    Propagate the masks a hint starts from (see _hint_start).
+
+    param words: the encrypted (lowercase) words
+    param start: tuple of the list of masks and the bit mask of the cipher
+                 letters changed since they were propagated (None if never)
+    param dictionary: the words to use
+    return: the propagated list of masks
+    """
+    masks, changed = start
+    if _PROFILE is None:
+        return propagate_masks(words, list(masks), dictionary, changed)
+    with _PROFILE.phase("solve"):
+        return propagate_masks(words, list(masks), dictionary, changed)
+
+
+def _grade_hints(gram: str, results, dictionary: Dictionary):
+    """
+    Generator of graded solutions for the propagated masks of each hint,
+    skipping masks already graded (they can not beat the earlier copy).
+
+    param gram: Cryptogram being solved
+    param results: iterable of propagated lists of masks
+    param dictionary: the words to use
+    return: generator of (score, Solution) tuples
+    """
+    graded = set()
+    for masks in results:
+        if tuple(masks) in graded:
+            continue
+        graded.add(tuple(masks))
+
+        if _PROFILE is None:
+            solution = Solution(gram, masks, dictionary)
+        else:
+            with _PROFILE.phase("grade"):
+                solution = Solution(gram, masks, dictionary)
+        yield solution.score, solution
+
+
+def _possible_english_words(word_counts: dict, masks: list,
+                            dictionary: Dictionary) -> int:
+    """
+    Count the words that can still decrypt to an English word, the most
+    English words any solution reachable from these masks can have.
+
+    param word_counts: dictionary of encrypted word to times it is used
+    param masks: list of masks indexed by cipher letter
+    param dictionary: the words to use
+    return: number of word uses with at least one dictionary match left
+    """
+    possible = 0
+    for word, count in word_counts.items():
+        tmpl, cipher_idx = _word_letters(word)
+        if tmpl in dictionary.templates:
+            allowed = tuple((masks[idx] & _ALL_LETTERS) or _ALL_LETTERS
+                            for idx in cipher_idx)
+            if dictionary.match_template(tmpl, allowed)[0]:
+                possible += count
+    return possible
+
+
+def search_solution(gram: str, valids: dict = None,
+                    time_limit: float = _SEARCH_TIME_LIMIT,
+                    node_limit: int = _SEARCH_NODE_LIMIT,
+                    dictionary: Dictionary = None) -> ((int, int), Solution):
+    """
+    Solve the cryptogram with a depth first search on top of propagation.
+    At each step the unsolved letter with the fewest possible values is
+    fixed to each of its values in turn (most used English letters first)
+    and the choice is propagated.  Branches that end in a contradiction, or
+    that can no longer produce more English words than the best solution
+    found so far, are abandoned.  When propagating every word already ends
+    in a contradiction, the search uses the words that agree with each
+    other (see _consistent_words).
+
+    The search stops when the whole tree is searched, after time_limit
+    seconds or after node_limit choices, whichever comes first.  It never
+    does worse than plain propagation (solve_cryptogram).
+
+    param gram: Cryptogram to solve
+    param valids: the starting selection of valid letters (hints)
+    param time_limit: seconds the search may take
+    param node_limit: maximum number of choices to try
+    param dictionary: the words to use (default_dictionary() if None)
+    return: Tuple of the best solution's score and the Solution.
+    """
+    # the first solution is plain propagation's, so there always is one
+    return deque(_search_solutions(gram, valids, time_limit, node_limit, dictionary),
+                 maxlen=1).pop()
+
+
+def _search_solutions(gram: str, valids: dict, time_limit: float, node_limit: int,
+                      dictionary: Dictionary, stopped=None):
+    """
+    Generator of the ever better solutions found by search_solution.
+
+    param gram: Cryptogram to solve
+    param valids: the starting selection of valid letters (hints)
+    param time_limit: seconds the search may take
+    param node_limit: maximum number of choices to try
+    param dictionary: the words to use (default_dictionary() if None)
+    param stopped: function returning True when the search should stop
+                   early, or None
+    return: generator of (score, Solution) tuples, starting with plain
+            propagation, each one better than the one before.
+    """
+    dictionary = dictionary or default_dictionary()
+    words = cipher_words(gram)
+    word_counts = Counter(words)
+    deadline = time.monotonic() + time_limit
+    nodes = 0
+
+    # letter_ranks[n] is the place of the most selective word using the
+    # n-th cipher letter in _selectivity_order
+    unique_words = tuple(dict.fromkeys(words))
+    letter_ranks = [len(unique_words)] * len(_LETTER_BITS)
+    for rank, word_no in enumerate(_selectivity_order(unique_words, dictionary)):
+        for ltr in unique_words[word_no]:
+            if ltr in _LETTER_BITS:
+                letter_ranks[ord(ltr) - ord('a')] = min(letter_ranks[ord(ltr) - ord('a')], rank)
+
+    # every choice is made on the one state and undone after
+    start = possibles_to_masks(valids or {})
+    state = SolverState(words, start, dictionary)
+    consistent = state.propagate()
+    masks = state.masks
+    best_ans = Solution(gram, list(masks), dictionary)
+    best_sco = best_ans.score
+    yield best_sco, best_ans
+
+    if not consistent:
+        # search with the words that agree with each other instead
+        state = SolverState(_consistent_words(words, start, dictionary), start, dictionary)
+        consistent = state.propagate()
+        masks = state.masks
+        if consistent:
+            ans = Solution(gram, list(masks), dictionary)
+            if is_better(ans.score, best_sco):
+                best_ans, best_sco = ans, ans.score
+                yield best_sco, best_ans
+
+    def search() -> bool:
+        """ search below the state's masks, yielding better solutions, return
+            False when out of budget """
+        nonlocal nodes, best_ans, best_sco
+
+        # Give up on branches that can not beat the best so far
+        possible = _possible_english_words(word_counts, masks, dictionary)
+        if possible < best_sco[1] or (possible == best_sco[1] and 0 == best_sco[0]):
+            return True
+
+        # choose the unsolved letter with the fewest possible values (MRV),
+        # of those the one in the most selective word
+        branch_idx, branch_key = None, (len(_LETTER_FREQUENCY_ORDER) + 1, 0)
+        for idx, mask in enumerate(masks):
+            key = mask.bit_count(), letter_ranks[idx]
+            if not mask & _UNKNOWN and 1 < key[0] and key < branch_key:
+                branch_idx, branch_key = idx, key
+
+        if branch_idx is None:
+            ans = Solution(gram, list(masks), dictionary)
+            sco = ans.score
+            if is_better(sco, best_sco):
+                best_ans, best_sco = ans, sco
+                yield best_sco, best_ans
+            return True
+
+        choices = masks[branch_idx]
+        for ltr in _LETTER_FREQUENCY_ORDER:
+            if not choices & _LETTER_BITS[ltr]:
+                continue
+
+            nodes += 1
+            if nodes > node_limit or time.monotonic() > deadline \
+                    or (stopped is not None and stopped()):
+                return False
+
+            mark = state.mark()
+            state.assign(branch_idx, _LETTER_BITS[ltr])
+            within_budget = not state.propagate() or (yield from search())
+            state.undo(mark)
+            if not within_budget:
+                return False
+
+        return True
+
+    try:
+        if consistent:
+            yield from search()
+    finally:
+        if _PROFILE is not None:
+            _PROFILE.count("search nodes", nodes)
+
+
+def _consistent_words(words: list, masks: list, dictionary: Dictionary) -> list:
+    """
+    Choose words to search with when propagating all of them ends in a
+    contradiction (some are not English, or not with the letters the
+    others need).  Words are added from the most selective on (see
+    _selectivity_order) and each is kept only if the masks stay consistent
+    when it is propagated with the words kept before it.
+
+    param words: the encrypted (lowercase) words
+    param masks: list of masks indexed by cipher letter to start from
+    param dictionary: the words to use
+    return: list of the words kept, in text order
+    """
+    unique_words = tuple(dict.fromkeys(words))
+    kept = set()
+    masks = list(masks)
+    for word_no in _selectivity_order(unique_words, dictionary):
+        word = unique_words[word_no]
+        changed = 0
+        for idx in _word_letters(word)[1]:
+            changed |= 1 << idx
+        trial = propagate_masks([other for other in unique_words if other in kept or other == word],
+                                list(masks), dictionary, changed)
+        if _is_consistent(trial):
+            kept.add(word)
+            masks = trial
+    return [word for word in words if word in kept]
+
+
+def _is_consistent(masks: list) -> bool:
+    """
+    Check masks for contradictions: a cipher letter with no possible value
+    left, or two cipher letters solved to the same letter.
+
+    param masks: list of masks indexed by cipher letter
+    return: True if no contradiction was found
+    """
+    solved = 0
+    for mask in masks:
+        if 0 == mask:
+            return False
+        if 1 == mask.bit_count():
+            if solved & mask:
+                return False
+            solved |= mask
+    return True
+
+
+class NgramModel:
+    """
+    Log probabilities of English quadgrams, used to score whole keys (see
+    ngram_solution).  An n-gram is a run of letters within a word, where
+    the start and end of the word also count as a symbol.  The counts come
+    from a quadgram file when one is given, otherwise from the words of a
+    dictionary.  Nothing is read until the table is first needed.
+    """
+
+    def __init__(self, ngram_file: str = None, dictionary: Dictionary = None):
+        """
+        param ngram_file: path of a file of "QUAD count" lines
+        param dictionary: dictionary to count quadgrams in when there is no
+                          ngram_file (default_dictionary() if None)
+        """
+        self.ngram_file = ngram_file
+        self.dictionary = dictionary
+        self._table = None
+
+    def load(self) -> "NgramModel":
+        """
+        Build the table of log probabilities if that has not been done yet.
+
+        return: this model
+        """
+        if self._table is None:
+            start = time.perf_counter()
+            if self.ngram_file is not None:
+                counts = _read_ngram_counts(self.ngram_file)
+            else:
+                counts = _count_ngrams((self.dictionary or default_dictionary()).words)
+
+            total = sum(counts.values()) or 1
+            table = [math.log10(0.01 / total)] * (_BOUNDARY + 1) ** _NGRAM_LENGTH
+            for code, count in counts.items():
+                table[code] = math.log10(count / total)
+            self._table = table if np is None else np.array(table)
+
+            if _PROFILE is not None:
+                _PROFILE.add_time("ngram load", time.perf_counter() - start)
+
+        return self
+
+    @property
+    def table(self):
+        """ log10 probability of each n-gram code (see _ngram_code) """
+        return self.load()._table
+
+
+@functools.lru_cache(maxsize=None)
+def default_ngram_model() -> NgramModel:
+    """
+    Get the n-gram model used when none is given: english_quadgrams.txt
+    (looked for like words_alpha.txt, see _default_word_file) if there is
+    one, otherwise the quadgrams of default_dictionary().
+
+    return: the default n-gram model
+    """
+    ngram_file = _default_word_file(_NGRAM_FILE)
+    return NgramModel(ngram_file if os.path.exists(ngram_file) else None)
+
+
+def _ngram_code(symbols) -> int:
+    """
+    Number an n-gram for the model's table.
 
-    return freqs
+    param symbols: the n-gram's symbols (0-25 for a-z, _BOUNDARY for a word
+                   start or end)
+    return: the n-gram's code
+    """
+    code = 0
+    for symbol in symbols:
+        code = code * (_BOUNDARY + 1) + symbol
+    return code
 
 
-def find_best_solution_with_hints(gram: str, hints_lst: list = None) -> ((int,int),str):
+def _ngram_symbols(words) -> list:
     """
-    Receive a list of hints (Hints are starting valids dictionaries). Solve
-    the cryptogram with each of the hint sets in the list, determine which
-    is best, and return the solution and its associated score.
+    Turn words into one list of n-gram symbols, each word between
+    boundaries.  Characters other than a-z are dropped.
+
+    param words: iterable of lowercase words
+    return: list of symbols (see _ngram_code)
+    """
+    symbols = [_BOUNDARY]
+    for word in words:
+        symbols.extend(ord(ltr) - ord('a') for ltr in word if ltr in _LETTER_BITS)
+        symbols.append(_BOUNDARY)
+    return symbols
+
+
+def _count_ngrams(words) -> Counter:
+    """
+    Count the quadgrams of a list of words, each word counted once.
+
+    param words: iterable of lowercase words
+    return: Counter of n-gram code to number of uses
+    """
+    # The words are run together between double boundaries ('{' is the
+    # byte after 'z').  The n-grams spanning two words then all hold two
+    # boundaries in a row, which no cryptogram has, so they do not disturb
+    # the counts that matter.
+    stream = b"{" + "{{".join(words).encode("ascii", "ignore").translate(
+        None, _NON_NGRAM_BYTES) + b"{"
+    size = (_BOUNDARY + 1) ** _NGRAM_LENGTH
+
+    if np is not None:
+        symbols = np.frombuffer(stream, dtype=np.uint8).astype(np.intp) - ord('a')
+        codes = np.zeros(len(symbols) - _NGRAM_LENGTH + 1, dtype=np.intp)
+        for pos in range(_NGRAM_LENGTH):
+            codes = codes * (_BOUNDARY + 1) + symbols[pos:len(codes) + pos]
+        counts = np.bincount(codes, minlength=size)
+        return Counter({int(code): int(counts[code]) for code in np.flatnonzero(counts)})
+
+    def code_stream():
+        code = 0
+        for pos, byte in enumerate(stream):
+            code = (code * (_BOUNDARY + 1) + byte - ord('a')) % size
+            if pos >= _NGRAM_LENGTH - 1:
+                yield code
+
+    return Counter(code_stream())
+
+
+def _read_ngram_counts(ngram_file: str) -> Counter:
+    """
+    Read a quadgram count file: one quadgram and its count per line, such
+    as "TION 13168375".  Quadgrams of other lengths or with characters other
+    than a-z are ignored.
+
+    param ngram_file: path of the file
+    return: Counter of n-gram code to count
+    """
+    counts = Counter()
+    with open(ngram_file, "r", encoding="utf-8") as src:
+        for line in src:
+            fields = line.split()
+            if 2 == len(fields) and _NGRAM_LENGTH == len(fields[0]) and fields[1].isdigit():
+                ngram = fields[0].lower()
+                if all(ltr in _LETTER_BITS for ltr in ngram):
+                    counts[_ngram_code(ord(ltr) - ord('a') for ltr in ngram)] += int(fields[1])
+    return counts
+
+
+def ngram_solution(gram: str, model: NgramModel = None,
+                   restarts: int = _NGRAM_RESTARTS,
+                   time_limit: float = _NGRAM_TIME_LIMIT,
+                   seed: int = None,
+                   dictionary: Dictionary = None) -> (float, Solution):
+    """
+    Solve the cryptogram without relying on every word being in the
+    dictionary: score complete keys by how English their quadgrams are
+    and hill climb.  Each climb repeatedly makes the best swap of two
+    letters in the key until no swap improves the score.  The first climb
+    starts from the letters ordered by frequency, the rest from random
+    keys, and the best key found is kept.  Works best on longer texts, and
+    copes with names and typos that the dictionary engines can not place.
+
+    With numpy every swap of a step is scored at once; without it only the
+    n-grams a swap changes are scored again.
 
     param gram: Cryptogram to solve
-    param hints_lst: List of dictionaries where each dictionary is the starting
-                     selection of valid letters.
-    return: Tuple of the solution's score and the solution.
+    param model: the n-gram model (default_ngram_model() if None)
+    param restarts: number of climbs
+    param time_limit: seconds to stop starting new climbs after
+    param seed: seed for the random starting keys
+    param dictionary: the words to grade the solution with
+                      (default_dictionary() if None)
+    return: Tuple of the n-gram score (a log10 probability) of the best key
+            and its Solution.
     """
-    best_ans, best_sco = None, None
-    if hints_lst is None:
-        hints_lst = [{}]
+    # the first climb always yields its key, so there always is one
+    return deque(_ngram_solutions(gram, model, restarts, time_limit, seed, dictionary),
+                 maxlen=1).pop()
 
-    for hints in hints_lst:
-        ans = solve_cryptogram(gram, hints)
-        sco = grade_solution(ans)
-        if (best_ans is None) or (is_better(sco, best_sco)):
-            best_ans = ans
+
+def _ngram_solutions(gram: str, model: NgramModel, restarts: int, time_limit: float,
+                     seed: int, dictionary: Dictionary, stopped=None):
+    """
+    Generator of the ever better solutions found by ngram_solution.
+
+    param gram: Cryptogram to solve
+    param model: the n-gram model (default_ngram_model() if None)
+    param restarts: number of climbs
+    param time_limit: seconds to stop starting new climbs after
+    param seed: seed for the random starting keys
+    param dictionary: the words to grade the solutions with
+    param stopped: function returning True when no more climbs should be
+                   started, or None
+    return: generator of (n-gram score, Solution) tuples, one for each
+            climb that ends with a better key than all the climbs before it.
+    """
+    table = (model or default_ngram_model()).table
+    rng = random.Random(seed)
+    deadline = time.monotonic() + time_limit
+
+    symbols = _ngram_symbols(cipher_words(gram))
+    ngrams = [tuple(symbols[pos:pos + _NGRAM_LENGTH])
+              for pos in range(len(symbols) - _NGRAM_LENGTH + 1)]
+    used = sorted(set(symbols) - {_BOUNDARY})
+    swaps = [(first, second) for first, second
+             in itertools.combinations(range(len(string.ascii_lowercase)), 2)
+             if first in used or second in used]
+
+    # the first key maps the most used cipher letters to the most used
+    # English letters
+    by_use = Counter(sym for sym in symbols if sym != _BOUNDARY)
+    cipher_order = sorted(range(len(string.ascii_lowercase)), key=lambda sym: -by_use[sym])
+    key = [0] * len(string.ascii_lowercase)
+    for sym, ltr in zip(cipher_order, _LETTER_FREQUENCY_ORDER):
+        key[sym] = ord(ltr) - ord('a')
+
+    climb = _climb_python if np is None else _climb_numpy
+    best_sco = None
+    for restart in range(max(restarts, 1)):
+        if restart:
+            if time.monotonic() > deadline or (stopped is not None and stopped()):
+                break
+            key = list(range(len(string.ascii_lowercase)))
+            rng.shuffle(key)
+
+        sco, key = climb(ngrams, key, swaps, table)
+        if best_sco is None or sco > best_sco:
             best_sco = sco
+            yield best_sco, Solution(gram, [1 << ltr for ltr in key], dictionary)
 
-    return best_sco, best_ans
 
-def find_best_solution(gram: str) -> str:
+def _climb_numpy(ngrams: list, key: list, swaps: list, table) -> (float, list):
+    """
+    Hill climb from a key (see ngram_solution), scoring every swap of a
+    step at once with numpy.
+
+    param ngrams: the cryptogram's n-grams, tuples of cipher symbols
+    param key: English letter number of each cipher letter number
+    param swaps: pairs of cipher letters whose English letters may swap
+    param table: log probability of each n-gram code (see NgramModel)
+    return: tuple of the score of the final key and the key
+    """
+    places = np.array(ngrams, dtype=np.intp).reshape(-1, _NGRAM_LENGTH)
+    weights = (_BOUNDARY + 1) ** np.arange(_NGRAM_LENGTH - 1, -1, -1)
+    firsts = np.array([first for first, _ in swaps], dtype=np.intp)
+    seconds = np.array([second for _, second in swaps], dtype=np.intp)
+    rows = np.arange(len(swaps))
+
+    current = np.array(key + [_BOUNDARY], dtype=np.intp)
+    score = table[current[places] @ weights].sum()
+    keys_scored = 1
+
+    while len(swaps):
+        candidates = np.repeat(current[np.newaxis, :], len(swaps), axis=0)
+        candidates[rows, firsts] = current[seconds]
+        candidates[rows, seconds] = current[firsts]
+        scores = table[candidates[:, places] @ weights].sum(axis=1)
+        keys_scored += len(swaps)
+
+        best = int(scores.argmax())
+        if scores[best] <= score:
+            break
+        score, current = scores[best], candidates[best]
+
+    if _PROFILE is not None:
+        _PROFILE.count("keys scored", keys_scored)
+    return float(score), [int(ltr) for ltr in current[:-1]]
+
+
+def _climb_python(ngrams: list, key: list, swaps: list, table) -> (float, list):
+    """
+    Hill climb from a key (see ngram_solution) in pure Python, scoring
+    only the n-grams each swap changes.
+
+    param ngrams: the cryptogram's n-grams, tuples of cipher symbols
+    param key: English letter number of each cipher letter number
+    param swaps: pairs of cipher letters whose English letters may swap
+    param table: log probability of each n-gram code (see NgramModel)
+    return: tuple of the score of the final key and the key
+    """
+    # using[sym] lists the n-grams containing cipher symbol sym
+    using = [[] for _ in range(_BOUNDARY + 1)]
+    for ngram_no, ngram in enumerate(ngrams):
+        for sym in set(ngram):
+            using[sym].append(ngram_no)
+
+    current = key + [_BOUNDARY]
+    scores = [table[_ngram_code(current[sym] for sym in ngram)] for ngram in ngrams]
+    score = sum(scores)
+    keys_scored = 1
+
+    while True:
+        best_gain, best_swap = 0.0, None
+        for first, second in swaps:
+            changed = set(using[first]).union(using[second])
+            current[first], current[second] = current[second], current[first]
+            gain = sum(table[_ngram_code(current[sym] for sym in ngrams[ngram_no])]
+                       - scores[ngram_no] for ngram_no in changed)
+            current[first], current[second] = current[second], current[first]
+            if gain > best_gain:
+                best_gain, best_swap = gain, (first, second)
+        keys_scored += len(swaps)
+
+        if best_swap is None:
+            break
+        first, second = best_swap
+        current[first], current[second] = current[second], current[first]
+        for ngram_no in set(using[first]).union(using[second]):
+            scores[ngram_no] = table[_ngram_code(current[sym] for sym in ngrams[ngram_no])]
+        score = sum(scores)
+
+    if _PROFILE is not None:
+        _PROFILE.count("keys scored", keys_scored)
+    return score, current[:-1]
+
+
+def find_best_solution(gram: str, workers: int = 1, engine: str = "hints",
+                       dictionary: Dictionary = None, cache: "SolutionCache" = None) -> str:
     """
     Solve the supplied cryptogram.  Solve it many times supplying some
     hints as to the expected solution based on letter frequencies and
     other criteria.  Return the best answer out of all attempts.
 
     param gram: The cryptogram to solve
+    param workers: number of processes to solve hints with (see
+                   find_best_solution_with_hints)
+    param engine: 'hints' (described above), 'search' (see search_solution)
+                  or 'ngram' (see ngram_solution)
+    param dictionary: the words to use (default_dictionary() if None)
+    param cache: SolutionCache to look the cryptogram up in first and to
+                 save its solution in, or None
     return: The best solution.
     """
-    hints_list = [{}]
+    return _cached_solution(gram, workers, engine, dictionary, cache).text
+
+
+def _cached_solution(gram: str, workers: int, engine: str, dictionary: Dictionary,
+                     cache: "SolutionCache") -> Solution:
+    """
+    Look the cryptogram up in the cache, solve it if it is not there (see
+    find_best_solution).
+
+    param gram: The cryptogram to solve
+    param workers: number of processes to solve hints with
+    param engine: 'hints', 'search' or 'ngram'
+    param dictionary: the words to use (default_dictionary() if None)
+    param cache: SolutionCache to use, or None
+    return: The best Solution.
+    """
+    solution = None if cache is None else cache.get(gram, engine, dictionary)
+    if solution is None:
+        solution = _find_best_solution(gram, workers, engine, dictionary)
+        if cache is not None:
+            cache.put(solution, engine, dictionary)
+    return solution
+
+
+def _find_best_solution(gram: str, workers: int, engine: str,
+                        dictionary: Dictionary) -> Solution:
+    """
+    Solve the cryptogram (see find_best_solution).
+
+    param gram: The cryptogram to solve
+    param workers: number of processes to solve hints with
+    param engine: 'hints', 'search' or 'ngram'
+    param dictionary: the words to use (default_dictionary() if None)
+    return: The best Solution.
+    """
+    if "search" == engine:
+        if _PROFILE is None:
+            return search_solution(gram, dictionary=dictionary)[1]
+        with _PROFILE.phase("search"):
+            return search_solution(gram, dictionary=dictionary)[1]
+    if "ngram" == engine:
+        if _PROFILE is None:
+            return ngram_solution(gram, dictionary=dictionary)[1]
+        with _PROFILE.phase("ngram"):
+            return ngram_solution(gram, dictionary=dictionary)[1]
+    if "hints" != engine:
+        raise ValueError(f"unknown engine {engine!r}, expected one of {_ENGINES}")
+
+    return find_best_solution_with_hints(gram, build_hints(gram), workers, dictionary)[1]
+
+
+def build_hints(gram: str) -> list:
+    """
+    Build the hints find_best_solution tries: none at all, then guesses
+    based on letter frequencies, common letter pairs and one letter words.
+
+    param gram: The cryptogram to solve
+    return: list of hints (starting valids dictionaries)
+    """
+    return [hints for _, hints in _ranked_hints(gram)]
+
+
+def _ranked_hints(gram: str) -> list:
+    """
+    Build the hints of build_hints, each with a rough rank of how likely it
+    is to be right: the sum of the places of the cipher letter (pair) in
+    the cryptogram and of the English letter (pair) guessed for it, most
+    used first.  Lower ranks are more promising.
+
+    param gram: The cryptogram to solve
+    return: list of (rank, hints) tuples in build_hints order
+    """
+    hints_list = [(0, {})]
 
     # Use letter frequency as a starting place
     freqs = most_used_letters(gram)
-    for encr in freqs:
-        for english in _MOST_COMMON_LETTERS:
+    for encr_rank, encr in enumerate(freqs):
+        for english_rank, english in enumerate(_MOST_COMMON_LETTERS):
             decrypt_key = {}
             add_to_valids(decrypt_key, encr, english)
-            hints_list.append(decrypt_key)
+            hints_list.append((1 + encr_rank + english_rank, decrypt_key))
 
     # Use most frequent sequential letters in English as hints.
     freqs = most_common_letter_pairs(gram)
-    for encr_pair in freqs:
+    for encr_rank, encr_pair in enumerate(freqs):
         # choose proper pair list (double letters or not)
         if encr_pair[0] == encr_pair[1]:
             pair_list = _MOST_COMMON_DOUBLES
         else:
             pair_list = _MOST_COMMON_PAIRS
 
-        for eng_pair in pair_list:
+        for english_rank, eng_pair in enumerate(pair_list):
             decrypt_key = {}
             add_to_valids(decrypt_key, encr_pair[0], eng_pair[0])
             add_to_valids(decrypt_key, encr_pair[1], eng_pair[1])
-            hints_list.append(decrypt_key)
+            hints_list.append((1 + encr_rank + english_rank, decrypt_key))
 
     # Try A or I for single letter words.
     for one_letter_word in one_letter_words(gram):
-        for ltr in ['a','i']:
+        for english_rank, ltr in enumerate(['a','i']):
             decrypt_key = {}
             add_to_valids(decrypt_key, one_letter_word, ltr)
-            hints_list.append(decrypt_key)
+            hints_list.append((1 + english_rank, decrypt_key))
+
+    return hints_list
+
+
+def solve_anytime(gram: str, engine: str = "hints", time_limit: float = None,
+                  cancel=None, workers: int = 1, dictionary: Dictionary = None):
+    """
+    Solve the cryptogram, handing over each better solution as soon as it
+    is found rather than only the best one at the end.  A caller can show
+    the solutions as they come and stop whenever one is good enough: by
+    time_limit, by setting cancel, or simply by not asking for more (the
+    generator stops its work when it is closed).
+
+    The first solution comes right away (plain propagation for the hints
+    and search engines, the first climb for the ngram engine).  The hints
+    engine then tries the most promising hints first (see _ranked_hints),
+    the search engine searches as search_solution does and the ngram
+    engine keeps climbing from random keys.  Left to run to the end, the
+    last solution is the one find_best_solution returns.
+
+    param gram: The cryptogram to solve
+    param engine: 'hints', 'search' or 'ngram' (see find_best_solution)
+    param time_limit: seconds after which no more work is started (None
+                      for no limit other than the engine's own)
+    param cancel: stop once cancel.is_set() is true (a threading.Event,
+                  multiprocessing.Event, ...), or None
+    param workers: number of processes to solve hints with (see
+                   find_best_solution_with_hints)
+    param dictionary: the words to use (default_dictionary() if None)
+    return: generator of (score, Solution) tuples, each better than the one
+            before.  Scores are those of the engine: (choices left, English
+            words) for hints and search, an n-gram log10 probability for
+            ngram.
+    """
+    if engine not in _ENGINES:
+        raise ValueError(f"unknown engine {engine!r}, expected one of {_ENGINES}")
+
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+
+    def stopped() -> bool:
+        return (deadline is not None and time.monotonic() > deadline) \
+            or (cancel is not None and cancel.is_set())
+
+    if "search" == engine:
+        return _search_solutions(gram, None, _SEARCH_TIME_LIMIT, _SEARCH_NODE_LIMIT,
+                                 dictionary, stopped)
+    if "ngram" == engine:
+        return _ngram_solutions(gram, None, _NGRAM_RESTARTS, _NGRAM_TIME_LIMIT, None,
+                                dictionary, stopped)
+    return _anytime_hints(gram, workers, dictionary or default_dictionary(), stopped)
+
+
+def _anytime_hints(gram: str, workers: int, dictionary: Dictionary, stopped):
+    """
+    Generator of the ever better solutions of the hints engine, trying
+    the most promising hints first (see solve_anytime).  Ties go to the
+    hint that comes first in build_hints order, as in
+    find_best_solution_with_hints, so the last solution is the same.
+
+    param gram: The cryptogram to solve
+    param workers: number of processes to solve hints with
+    param dictionary: the words to use
+    param stopped: function returning True when no more hints should be
+                   tried
+    return: generator of (score, Solution) tuples
+    """
+    words = cipher_words(gram)
+    ranked = _ranked_hints(gram)
+    root = _propagate_hint(words, ([_UNCONSTRAINED] * len(_LETTER_BITS), None), dictionary)
+    best_sco, best_no, best_masks = None, None, None
+    graded = {}     # masks -> their score
+
+    def improve(hint_no: int, masks: list):
+        """ grade a hint's masks, return (score, Solution) if it is the new best """
+        nonlocal best_sco, best_no, best_masks
+        # masks seen before, from a hint further down the ranking, are not
+        # graded again but may still win a tie by their smaller number here
+        key = tuple(masks)
+        sco = graded.get(key)
+        solution = None
+        if sco is None:
+            solution = Solution(gram, masks, dictionary)
+            sco = graded[key] = solution.score
+
+        if best_sco is None or is_better(sco, best_sco) \
+                or (hint_no < best_no and not is_better(best_sco, sco)):
+            same = key == best_masks
+            best_sco, best_no, best_masks = sco, hint_no, key
+            if not same:
+                return sco, solution or Solution(gram, masks, dictionary)
+        return None
+
+    # the first hint is no hint at all
+    yield improve(0, root)
+
+    # a start seen before is solved once, under the smallest hint number
+    # that has it (ties go to it)
+    starts, seen = [], {tuple(root): None}
+    for hint_no in sorted(range(1, len(ranked)), key=lambda hint_no: ranked[hint_no][0]):
+        start = _hint_start(root, ranked[hint_no][1])
+        if start is None:
+            continue
+        pos = seen.setdefault(tuple(start[0]), len(starts))
+        if pos == len(starts):
+            starts.append((hint_no, start))
+        elif pos is not None and hint_no < starts[pos][0]:
+            starts[pos] = (hint_no, start)
+
+    if workers == 1 or len(starts) < 2:
+        for hint_no, start in starts:
+            if stopped():
+                return
+            result = improve(hint_no, _propagate_hint(words, start, dictionary))
+            if result is not None:
+                yield result
+        return
+
+    # load before forking so the workers share the words
+    dictionary.load()
+    with process_pool(workers) as pool:
+        pending = {pool.submit(_propagate_hint, words, start, dictionary): hint_no
+                   for hint_no, start in starts}
+        try:
+            while pending and not stopped():
+                done, _ = concurrent.futures.wait(
+                    pending, timeout=_ANYTIME_POLL,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in sorted(done, key=pending.get):
+                    result = improve(pending.pop(future), future.result())
+                    if result is not None:
+                        yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class SolutionCache:
+    """
+    Solutions saved on disk (in an SQLite database) so a cryptogram solved
+    before is not solved again.  Solutions are looked up by the
+    cryptogram's template (see gram_template), so a repeat of a cryptogram
+    with a different substitution key is found too: the saved letter
+    masks are kept in order of first use and are mapped back onto the
+    letters of the cryptogram at hand.  The engine and the dictionary's
+    words are part of the lookup.
+
+    At most max_entries solutions are kept; the least recently used ones
+    are dropped to make room.  The cache only ever saves work: when the
+    database can not be read or written the cryptogram is simply solved.
+    Several processes can share one cache file.
+    """
+
+    def __init__(self, path: str, max_entries: int = _CACHE_SIZE):
+        """
+        param path: path of the cache database, created if missing
+        param max_entries: number of solutions to keep
+        """
+        self.path = os.path.abspath(path)
+        self.max_entries = max_entries
+        self._connection = None
+        self._pid = None
+
+    def __reduce__(self):
+        # each process opens its own connection
+        return SolutionCache, (self.path, self.max_entries)
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        return: this process's connection to the database
+        """
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS solutions "
+                               "(key BLOB PRIMARY KEY, masks BLOB NOT NULL, "
+                               "used INTEGER NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS solutions_used "
+                               "ON solutions (used)")
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def close(self) -> None:
+        """ Close this process's connection to the database. """
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def __len__(self) -> int:
+        try:
+            return self._connect().execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    @staticmethod
+    def _key(gram: str, engine: str, dictionary: Dictionary) -> (bytes, str):
+        """
+        param gram: the cryptogram
+        param engine: the engine solving it
+        param dictionary: the words to use (default_dictionary() if None)
+        return: tuple of the lookup key and the cryptogram's letters in
+                order of first use (see gram_template)
+        """
+        template, letters = gram_template(gram)
+        digest = hashlib.sha256(f"{_CACHE_VERSION}\0{engine}\0".encode("ascii"))
+        digest.update((dictionary or default_dictionary()).fingerprint)
+        digest.update(template.encode("utf-8"))
+        return digest.digest(), letters
+
+    def get(self, gram: str, engine: str = "hints",
+            dictionary: Dictionary = None) -> Solution:
+        """
+        Look up a cryptogram's solution.
+
+        param gram: the cryptogram
+        param engine: the engine that should have solved it
+        param dictionary: the words to use (default_dictionary() if None)
+        return: the Solution, or None if there is none saved
+        """
+        key, letters = self._key(gram, engine, dictionary)
+        try:
+            connection = self._connect()
+            row = connection.execute("SELECT masks FROM solutions WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE solutions SET used = ? WHERE key = ?",
+                                   (time.time_ns(), key))
+        except sqlite3.Error:
+            row = None
+        if row is None or len(row[0]) != 4 * len(letters):
+            if _PROFILE is not None:
+                _PROFILE.count("cache misses")
+            return None
+
+        if _PROFILE is not None:
+            _PROFILE.count("cache hits")
+        masks = [_UNCONSTRAINED] * len(_LETTER_BITS)
+        for ltr, mask in zip(letters, struct.unpack(f"<{len(letters)}I", row[0])):
+            masks[ord(ltr) - ord('a')] = mask
+        return Solution(gram, masks, dictionary)
+
+    def put(self, solution: Solution, engine: str = "hints",
+            dictionary: Dictionary = None) -> None:
+        """
+        Save a solution, dropping the least recently used solutions if the
+        cache is full.
+
+        param solution: the Solution of a cryptogram
+        param engine: the engine that solved it
+        param dictionary: the words it was solved with (default_dictionary()
+                          if None)
+        """
+        key, letters = self._key(solution.gram, engine, dictionary)
+        masks = struct.pack(f"<{len(letters)}I",
+                            *(solution.masks[ord(ltr) - ord('a')] for ltr in letters))
+        try:
+            connection = self._connect()
+            connection.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)",
+                               (key, masks, time.time_ns()))
+            extra = connection.execute("SELECT COUNT(*) FROM solutions").fetchone()[0] \
+                - self.max_entries
+            if extra > 0:
+                connection.execute("DELETE FROM solutions WHERE key IN (SELECT key FROM "
+                                   "solutions ORDER BY used LIMIT ?)", (extra,))
+        except sqlite3.Error:
+            pass
+
+
+def read_cryptograms(lines):
+    """
+    Generator of the cryptograms in a file (or any iterable of lines), one
+    cryptogram per line.  Blank lines are skipped.
+
+    param lines: the lines to read (an open file, sys.stdin, a list, ...)
+    return: generator of (line number, cryptogram) tuples
+    """
+    for line_no, line in enumerate(lines, start=1):
+        gram = line.strip()
+        if gram:
+            yield line_no, gram
+
+
+def solve_timed(item: (int, str), engine: str = "hints",
+                dictionary: Dictionary = None, cache: SolutionCache = None) -> dict:
+    """
+    Solve one cryptogram from read_cryptograms and time it.
+
+    param item: tuple of the line number and the cryptogram
+    param engine: the solver engine to use (see find_best_solution)
+    param dictionary: the words to use (default_dictionary() if None)
+    param cache: SolutionCache to use, or None
+    return: dictionary with the line number, cryptogram, solution and the
+            time taken in seconds.
+    """
+    line_no, gram = item
+    start = time.perf_counter()
+    answer = find_best_solution(gram, engine=engine, dictionary=dictionary, cache=cache)
+    return {"line": line_no,
+            "cryptogram": gram,
+            "solution": answer,
+            "seconds": round(time.perf_counter() - start, 6)}
+
+
+def solve_batch(items, workers: int = 1, engine: str = "hints",
+                dictionary: Dictionary = None, cache: SolutionCache = None):
+    """
+    Generator that solves a stream of cryptograms, yielding each result as
+    soon as it (and every result before it) is ready.  Results are always
+    yielded in input order.  With several workers each one solves whole
+    cryptograms and only a few cryptograms are read ahead, so the input
+    can be arbitrarily long.
+
+    param items: iterable of (line number, cryptogram) tuples
+    param workers: number of processes to solve with (None for one per CPU)
+    param engine: the solver engine to use (see find_best_solution)
+    param dictionary: the words to use (default_dictionary() if None)
+    param cache: SolutionCache to use, or None
+    return: generator of result dictionaries (see solve_timed)
+    """
+    dictionary = dictionary or default_dictionary()
+    solve_one = functools.partial(solve_timed, engine=engine, dictionary=dictionary, cache=cache)
+    if workers == 1:
+        yield from map(solve_one, items)
+        return
+
+    # load before forking so the workers share the words
+    dictionary.load()
+    with process_pool(workers) as pool:
+        read_ahead = 2 * (workers or os.cpu_count() or 1)
+        pending = deque()
+
+        for item in items:
+            pending.append(pool.submit(solve_one, item))
+            if len(pending) >= read_ahead:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def read_chunks(src, size: int = _STREAM_CHUNK):
+    """
+    Generator of the text of a file in chunks of about size characters.
+    Chunks end between words (only a word longer than a whole chunk is
+    split), so the words of the chunks are the words of the text.
+
+    param src: the open file to read
+    param size: characters to read at a time
+    return: generator of strings
+    """
+    carry = ""
+    while True:
+        text = src.read(size)
+        if not text:
+            break
+
+        chunk = carry + text
+        cut = len(chunk)
+        while cut and not chunk[cut - 1].isspace():
+            cut -= 1
+        if not cut:
+            cut = len(chunk)
+        carry = chunk[cut:]
+        yield chunk[:cut]
+
+    if carry:
+        yield carry
+
+
+def count_stream_words(chunks, max_words: int = _STREAM_TRACKED_WORDS) -> Counter:
+    """
+    Count the words of a text read in chunks (see read_chunks) without
+    keeping more than max_words different words.  When a new word does not
+    fit, every count drops by one and the words down to zero are forgotten
+    (Misra-Gries), so each count is low by at most words / max_words and
+    any word making up more than 1 / max_words of the text is kept.
+
+    param chunks: iterable of strings
+    param max_words: number of different words to keep count of
+    return: Counter of encrypted (lowercase) word to (about) times used
+    """
+    counts = Counter()
+    for chunk in chunks:
+        for word in cipher_words(chunk):
+            if word in counts:
+                counts[word] += 1
+            elif len(counts) < max_words:
+                counts[word] = 1
+            else:
+                for known in list(counts):
+                    counts[known] -= 1
+                    if not counts[known]:
+                        del counts[known]
+    return counts
+
+
+def stream_key_gram(word_counts: Counter, max_words: int = _STREAM_KEY_WORDS) -> str:
+    """
+    Make a small cryptogram to solve the key of a long text from: its most
+    common words, plus for each letter those leave out the most common
+    word using it.  Words with characters other than a-z are left out.
+
+    param word_counts: Counter of encrypted word to times used (see
+                       count_stream_words)
+    param max_words: number of most common words to use
+    return: the words, most common first, as one cryptogram
+    """
+    ordered = [word for word, _ in word_counts.most_common()
+               if word.isascii() and word.isalpha()]
+    chosen = ordered[:max_words]
 
-    return find_best_solution_with_hints(gram, hints_list)[1]
+    covered = set().union(*chosen)
+    for word in ordered[max_words:]:
+        if not covered.issuperset(word):
+            chosen.append(word)
+            covered.update(word)
+
+    return ' '.join(chosen)
+
+
+def solve_stream(src, workers: int = 1, engine: str = "hints",
+                 dictionary: Dictionary = None, cache: SolutionCache = None) -> Solution:
+    """
+    Solve the key of a ciphertext too long to solve as one cryptogram.  The
+    text is read in chunks counting its words (see count_stream_words), and
+    only a small cryptogram of its most common words is solved (see
+    stream_key_gram), so memory and solving time do not grow with the text.
+    Decode the text with decode_stream.
+
+    param src: the open file to read, from where it is now
+    param workers: number of processes to solve hints with
+    param engine: the solver engine to use (see find_best_solution)
+    param dictionary: the words to use (default_dictionary() if None)
+    param cache: SolutionCache to use, or None
+    return: the Solution of the small cryptogram
+    """
+    gram = stream_key_gram(count_stream_words(read_chunks(src)))
+    return _cached_solution(gram, workers, engine, dictionary, cache)
+
+
+def decode_table(solution: Solution) -> dict:
+    """
+    Make the str.translate table decoding text with a solution's letters,
+    each letter written the way build_answer writes it.  Other characters
+    are kept as they are.
+
+    param solution: the Solution whose letters to use
+    return: dictionary of character code to its decoded text
+    """
+    possibles = masks_to_possibles(solution.masks)
+    table = {}
+    for ltr in string.ascii_lowercase:
+        table[ord(ltr)] = build_answer(ltr, possibles)
+        table[ord(ltr.upper())] = build_answer(ltr.upper(), possibles)
+    return table
+
+
+def decode_stream(src, dst, solution: Solution, size: int = _STREAM_CHUNK) -> None:
+    """
+    Decode a text chunk by chunk with a solution (see solve_stream).
+
+    param src: the open file to read, from where it is now
+    param dst: the open file to write the decoded text to
+    param solution: the Solution whose letters to use
+    param size: characters to read at a time
+    """
+    table = decode_table(solution)
+    while True:
+        chunk = src.read(size)
+        if not chunk:
+            break
+        dst.write(chunk.translate(table))
 
 
 def create_cryptogram(txt: str) -> str:
     """
-    Create a cryptogram from a given text.
+    Create a cryptogram from a given text.  The key is drawn from the
+    random module (seed it for a reproducible cryptogram).
 
     param txt: Original text
     return: Cryptogram text
     """
-    enc_dict: dict = {}
+    key = []
     unused = list(string.ascii_lowercase)
 
-    for ltr in string.ascii_lowercase:
+    for _ in string.ascii_lowercase:
         enc_ltr = random.choice(unused)
         unused.remove(enc_ltr)
-        enc_dict[ltr] = [enc_ltr]
+        key.append(enc_ltr)
+
+    return encrypt(txt, ''.join(key))
+
+
+def random_key(rng: random.Random) -> str:
+    """
+    Draw a substitution key.  One random number picks one of the 26!
+    orders of the letters (read as a factorial base number, each digit
+    picks one of the letters left), faster than shuffling letter by letter.
+
+    param rng: the random number generator to draw with
+    return: the cipher letter of each letter a to z, as one string
+    """
+    code = rng.randrange(_KEY_COUNT)
+    unused = list(string.ascii_lowercase)
+    key = []
+    for radix in range(len(unused), 0, -1):
+        code, idx = divmod(code, radix)
+        key.append(unused.pop(idx))
+    return ''.join(key)
+
+
+def cipher_table(key: str) -> dict:
+    """
+    Make the str.translate table encrypting with a key, keeping each
+    letter's case.  Other characters are kept as they are.
+
+    param key: the cipher letter of each letter a to z (see random_key)
+    return: dictionary of character code to character code
+    """
+    return str.maketrans(string.ascii_lowercase + string.ascii_uppercase, key + key.upper())
+
+
+def encrypt(txt: str, key: str) -> str:
+    """
+    Encrypt a text with a key.
+
+    param txt: Original text
+    param key: the cipher letter of each letter a to z (see random_key)
+    return: Cryptogram text
+    """
+    return txt.translate(cipher_table(key))
+
+
+def corpus_texts(corpus_file: str, count: int = None):
+    """
+    Generator of the texts in a corpus file, one text per line.  Blank lines
+    are skipped.  The file is read over again from the start until count
+    texts were read, so any number of texts can come from a small corpus.
+
+    param corpus_file: file to read, '-' for standard input (read once)
+    param count: number of texts, None for each text in the file once
+    return: generator of strings
+    """
+    produced = 0
+    while count is None or produced < count:
+        found = False
+        with (contextlib.nullcontext(sys.stdin) if '-' == corpus_file
+              else open(corpus_file, "r", encoding="utf-8")) as src:
+            for _, txt in read_cryptograms(src):
+                if count is not None and produced >= count:
+                    return
+                found = True
+                produced += 1
+                yield txt
+        if not found or count is None or '-' == corpus_file:
+            return
+
+
+def generate_cryptograms(texts, seed: int, workers: int = 1):
+    """
+    Generator that encrypts a stream of texts, each with its own random
+    key, to make test and benchmark cryptograms in bulk.  Every
+    _GENERATE_BATCH texts get their keys from a generator seeded with the
+    seed and the batch number, so the same seed and texts always give the
+    same cryptograms, however many workers make them.  Only a few batches
+    are read ahead, so the stream can be arbitrarily long.
+
+    param texts: iterable of plain texts
+    param seed: random seed
+    param workers: number of processes to encrypt with (None for one per CPU)
+    return: generator of (plain text, key, cryptogram) tuples, in input
+            order (see random_key for the key)
+    """
+    def records(batch: list, encrypted: list):
+        for txt, (key, gram) in zip(batch, encrypted):
+            yield txt, key, gram
+
+    if workers == 1:
+        for batch_no, batch in enumerate(_text_batches(texts)):
+            yield from records(batch, _encrypt_batch(seed, batch_no, batch))
+        return
+
+    with process_pool(workers) as pool:
+        read_ahead = 2 * (workers or os.cpu_count() or 1)
+        pending = deque()
+
+        for batch_no, batch in enumerate(_text_batches(texts)):
+            pending.append((batch, pool.submit(_encrypt_batch, seed, batch_no, batch)))
+            if len(pending) >= read_ahead:
+                batch, future = pending.popleft()
+                yield from records(batch, future.result())
+
+        while pending:
+            batch, future = pending.popleft()
+            yield from records(batch, future.result())
+
+
+def _text_batches(texts):
+    """
+    Generator of the texts in lists of _GENERATE_BATCH (fewer at the end).
+
+    param texts: iterable of plain texts
+    return: generator of lists of texts
+    """
+    texts = iter(texts)
+    batch = list(itertools.islice(texts, _GENERATE_BATCH))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(texts, _GENERATE_BATCH))
+
+
+def _encrypt_batch(seed: int, batch_no: int, batch: list) -> list:
+    """
+    Encrypt a batch of texts (see generate_cryptograms).
+
+    param seed: random seed
+    param batch_no: number of the batch, counting from 0
+    param batch: list of plain texts
+    return: list of (key, cryptogram) tuples
+    """
+    rng = random.Random(f"{seed}:{batch_no}")
+    records = []
+    for txt in batch:
+        key = random_key(rng)
+        records.append((key, txt.translate(cipher_table(key))))
+    return records
+
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """
+    Parse the command line.
+
+    param argv: command line arguments (sys.argv[1:] if None)
+    return: the parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Attempt to solve a cryptogram.")
+    parser.add_argument("cryptogram", nargs="*",
+                        help="cryptogram to solve (a sample one if not given)")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of processes to solve with, 0 for one per CPU "
+                             "(default: 1)")
+    parser.add_argument("-b", "--batch", metavar="FILE",
+                        help="solve every line of FILE (- for standard input) and "
+                             "write the results as JSON lines")
+    parser.add_argument("-e", "--engine", choices=_ENGINES, default="hints",
+                        help="how to solve: try many hints, search for a complete "
+                             "solution, or hill climb on quadgram statistics "
+                             "(default: hints)")
+    parser.add_argument("-p", "--profile", action="store_true",
+                        help="print where the solving time went (to standard error)")
+    parser.add_argument("-d", "--words", metavar="FILE",
+                        help=f"word file to solve with, one word per line "
+                             f"(default: {_WORD_FILE})")
+    parser.add_argument("-f", "--frequencies", metavar="FILE",
+                        help=f"word frequency file, one word per line with the most "
+                             f"common first, used to try common words first "
+                             f"(default: {_FREQUENCY_FILE} if there is one)")
+    parser.add_argument("-s", "--stream", metavar="FILE",
+                        help="decode the long text in FILE (- for standard input) "
+                             "chunk by chunk, solving the key from its most common "
+                             "words, and write it to standard output")
+    parser.add_argument("-g", "--generate", metavar="FILE",
+                        help="encrypt every line of FILE (- for standard input) with "
+                             "a random key and write the plain text, key and "
+                             "cryptogram as JSON lines")
+    parser.add_argument("-n", "--count", type=int,
+                        help="with --generate, make this many cryptograms, reading "
+                             "FILE over again as needed (default: one per line)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="with --generate, random seed for the keys (default: 0)")
+    parser.add_argument("-c", "--cache", metavar="FILE",
+                        help="remember solutions in FILE and reuse them for "
+                             "cryptograms solved before, even with another key")
+    server = parser.add_mutually_exclusive_group()
+    server.add_argument("--serve", metavar="ADDRESS",
+                        help="keep running and solve requests sent to ADDRESS (a unix "
+                             "socket path, or [HOST:]PORT for TCP)")
+    server.add_argument("--connect", metavar="ADDRESS",
+                        help="have the server at ADDRESS (see --serve) do the solving")
+    parser.add_argument("-t", "--timeout", type=float,
+                        help=f"seconds a request to the server may take "
+                             f"(default: {_REQUEST_TIMEOUT:g})")
+    return parser.parse_args(argv)
+
+
+def run_batch(batch_file: str, workers: int, engine: str = "hints",
+              dictionary: Dictionary = None, cache: SolutionCache = None) -> int:
+    """
+    Solve a file of cryptograms (one per line) writing one JSON object per
+    cryptogram to standard output as soon as it is solved.
+
+    param batch_file: file to read, '-' for standard input
+    param workers: number of processes to solve with (None for one per CPU)
+    param engine: the solver engine to use (see find_best_solution)
+    param dictionary: the words to use (default_dictionary() if None)
+    param cache: SolutionCache to use, or None
+    return: 0 upon successful run
+    """
+    if '-' == batch_file:
+        src = sys.stdin
+    else:
+        src = open(batch_file, "r", encoding="utf-8")
+
+    with src:
+        for result in solve_batch(read_cryptograms(src), workers, engine, dictionary,
+                                  cache):
+            print(json.dumps(result), flush=True)
+
+    return 0
+
+
+def run_stream(stream_file: str, workers: int, engine: str = "hints",
+               dictionary: Dictionary = None, cache: SolutionCache = None) -> int:
+    """
+    Decode a long text (see solve_stream) to standard output.  The text is
+    read twice, once to solve the key and once to decode it, so standard
+    input is first copied to a temporary file.
+
+    param stream_file: file to read, '-' for standard input
+    param workers: number of processes to solve with (None for one per CPU)
+    param engine: the solver engine to use (see find_best_solution)
+    param dictionary: the words to use (default_dictionary() if None)
+    param cache: SolutionCache to use, or None
+    return: 0 upon successful run
+    """
+    if '-' == stream_file:
+        src = tempfile.TemporaryFile("w+", encoding="utf-8")
+        shutil.copyfileobj(sys.stdin, src, _STREAM_CHUNK)
+        src.seek(0)
+    else:
+        src = open(stream_file, "r", encoding="utf-8")
+
+    with src:
+        solution = solve_stream(src, workers, engine, dictionary, cache)
+        src.seek(0)
+        decode_stream(src, sys.stdout, solution)
+
+    return 0
+
+
+def run_generate(corpus_file: str, seed: int, count: int = None, workers: int = 1) -> int:
+    """
+    Write cryptograms made from a corpus (see generate_cryptograms) to
+    standard output, one JSON object per line holding the plain text, the
+    key and the cryptogram.
+
+    param corpus_file: file to read, '-' for standard input
+    param seed: random seed
+    param count: number of cryptograms, None for one per line of the file
+    param workers: number of processes to encrypt with (None for one per CPU)
+    return: 0 upon successful run
+    """
+    write = sys.stdout.write
+    for plain, key, gram in generate_cryptograms(corpus_texts(corpus_file, count), seed,
+                                                 workers):
+        write(json.dumps({"plain": plain, "key": key, "cryptogram": gram}))
+        write("\n")
+    sys.stdout.flush()
 
-    return build_answer(txt, enc_dict)
+    return 0
+
+
+def run_batch_remote(batch_file: str, address: str, engine: str = "hints",
+                     timeout: float = None) -> int:
+    """
+    Like run_batch, but have a server (see serve) do the solving.  A
+    cryptogram the server could not solve is written with an error instead
+    of a solution.
+
+    param batch_file: file to read, '-' for standard input
+    param address: the server's address (see parse_address)
+    param engine: the solver engine to use (see find_best_solution)
+    param timeout: seconds each cryptogram may take (the server's default if None)
+    return: 0 upon successful run, 1 if any cryptogram failed
+    """
+    if '-' == batch_file:
+        src = sys.stdin
+    else:
+        src = open(batch_file, "r", encoding="utf-8")
+
+    status = 0
+    with src:
+        try:
+            for response in request_solutions(address, read_cryptograms(src), engine, timeout):
+                response = {"line": response.pop("id"), **response}
+                if "error" in response:
+                    status = 1
+                print(json.dumps(response), flush=True)
+        except (OSError, ValueError) as exc:
+            print("ERROR:", exc, file=sys.stderr)
+            return 1
+
+    return status
+
+
+def parse_address(address: str):
+    """
+    Interpret a server address: a path (anything with a '/' in it, or
+    ending in .sock) is a unix socket, otherwise it is [HOST:]PORT for TCP
+    with the host defaulting to localhost.
+
+    param address: the address given on the command line
+    return: the socket path, or a tuple of the host and port number
+    """
+    if '/' in address or address.endswith(".sock"):
+        return address
+
+    host, _, port = address.rpartition(':')
+    try:
+        return host or "127.0.0.1", int(port)
+    except ValueError:
+        raise ValueError(f"bad server address {address!r}, expected a socket path "
+                         f"or [HOST:]PORT") from None
+
+
+def solve_request(request: dict, dictionary: Dictionary = None,
+                  cache: SolutionCache = None) -> dict:
+    """
+    Solve one server request (see serve).
+
+    param request: the request, with the cryptogram and optional id and engine
+    param dictionary: the words to use (default_dictionary() if None)
+    param cache: SolutionCache to use, or None
+    return: the response: the request id, cryptogram, solution and the
+            time taken in seconds.
+    """
+    start = time.perf_counter()
+    answer = find_best_solution(request["cryptogram"], engine=request.get("engine", "hints"),
+                                dictionary=dictionary, cache=cache)
+    return {"id": request.get("id"),
+            "cryptogram": request["cryptogram"],
+            "solution": answer,
+            "seconds": round(time.perf_counter() - start, 6)}
+
+
+def serve(address: str, workers: int = 1, engine: str = "hints",
+          timeout: float = _REQUEST_TIMEOUT, dictionary: Dictionary = None,
+          cache: SolutionCache = None) -> int:
+    """
+    Run a solving server until interrupted (Ctrl-C or SIGTERM).  The words
+    are loaded once, then shared by a pool of worker processes, so requests
+    do not pay for loading them.
+
+    Clients send one JSON object per line:
+        {"id": 1, "cryptogram": "...", "engine": "hints", "timeout": 10}
+    where only the cryptogram is required, and get one JSON object per line
+    back, as each request is done (not necessarily in order):
+        {"id": 1, "cryptogram": "...", "solution": "...", "seconds": 0.5}
+    or {"id": 1, "error": "..."} when it failed or timed out.  Sending
+    {"cancel": 1} drops request 1 if it has not been answered yet.  Any
+    number of clients can be connected at once, each with any number of
+    requests waiting.
+
+    A request that times out or is cancelled is dropped if no worker has
+    started it.  A worker that has already started one finishes it first,
+    since a running solve can not be interrupted.
+
+    param address: where to listen (see parse_address)
+    param workers: number of processes to solve with (None for one per CPU)
+    param engine: the engine for requests that do not name one
+    param timeout: seconds for requests that do not give a timeout
+    param dictionary: the words to use (default_dictionary() if None)
+    param cache: SolutionCache to use, or None
+    return: 0 upon successful run, 1 if the server could not be started
+    """
+    try:
+        asyncio.run(_serve(parse_address(address), workers, engine, timeout,
+                           dictionary or default_dictionary(), cache))
+    except KeyboardInterrupt:
+        pass
+    except (OSError, ValueError) as exc:
+        print("ERROR:", exc, file=sys.stderr)
+        return 1
+    return 0
+
+
+async def _serve(address, workers: int, engine: str, timeout: float,
+                 dictionary: Dictionary, cache: SolutionCache) -> None:
+    """
+    Listen for and answer clients (see serve).
+
+    param address: socket path, or tuple of host and port
+    param workers: number of processes to solve with (None for one per CPU)
+    param engine: the engine for requests that do not name one
+    param timeout: seconds for requests that do not give a timeout
+    param dictionary: the words to use
+    param cache: SolutionCache to use, or None
+    """
+    # load before forking so the workers share the words
+    dictionary.load()
+
+    # Ctrl-C reaches the workers too; only the server itself should stop
+    with process_pool(workers, _ignore_interrupts) as pool:
+        def client(reader, writer):
+            return _serve_client(reader, writer, pool, engine, timeout, dictionary, cache)
+
+        if isinstance(address, str):
+            # a socket left behind by a server that did not shut down cleanly
+            if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+                try:
+                    connect(address).close()
+                except ConnectionRefusedError:
+                    os.unlink(address)
+                else:
+                    raise OSError(f"a server is already running on {address}")
+            server = await asyncio.start_unix_server(client, address,
+                                                     limit=_REQUEST_LINE_LIMIT)
+        else:
+            server = await asyncio.start_server(client, *address, limit=_REQUEST_LINE_LIMIT)
+
+        # stop cleanly when asked to (kill, service managers)
+        stopping = asyncio.Event()
+        with contextlib.suppress(NotImplementedError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+
+        print("serving on", ", ".join(str(sock.getsockname()) for sock in server.sockets),
+              file=sys.stderr, flush=True)
+        try:
+            async with server:
+                await stopping.wait()
+        finally:
+            pool.shutdown(cancel_futures=True)
+            if isinstance(address, str) and os.path.exists(address):
+                os.unlink(address)
+
+
+def _ignore_interrupts() -> None:
+    """ Make this (worker) process ignore Ctrl-C """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+async def _serve_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                        pool: concurrent.futures.Executor, engine: str, timeout: float,
+                        dictionary: Dictionary, cache: SolutionCache) -> None:
+    """
+    Answer the requests of one client (see serve) until it disconnects.
+
+    param reader: stream of the client's requests
+    param writer: stream to send the responses to
+    param pool: the worker processes
+    param engine: the engine for requests that do not name one
+    param timeout: seconds for requests that do not give a timeout
+    param dictionary: the words to use
+    param cache: SolutionCache to use, or None
+    """
+    loop = asyncio.get_running_loop()
+    pending = set()         # solves not answered yet
+    waiting = {}            # request id -> its solve, until answered
+    answers = set()
+    write_lock = asyncio.Lock()
+
+    async def respond(response: dict) -> None:
+        async with write_lock:
+            if not writer.is_closing():
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                with contextlib.suppress(ConnectionError):
+                    await writer.drain()
+
+    async def answer(request: dict, solving: asyncio.Future) -> None:
+        request_id = request.get("id")
+        try:
+            response = await asyncio.wait_for(solving, request.get("timeout", timeout))
+        except asyncio.TimeoutError:
+            response = {"id": request_id, "error": "timed out"}
+        except asyncio.CancelledError:
+            response = {"id": request_id, "error": "cancelled"}
+        # whatever went wrong in the worker is the client's answer; the
+        # server keeps serving
+        except Exception as exc:            # pylint: disable=broad-exception-caught
+            response = {"id": request_id, "error": f"{type(exc).__name__}: {exc}"}
+        finally:
+            pending.discard(solving)
+            if request_id is not None and waiting.get(request_id) is solving:
+                del waiting[request_id]
+        await respond(response)
+
+    def start(request) -> None:
+        """ start solving one request, raise ValueError if it is not a valid one """
+        if not isinstance(request, dict):
+            raise ValueError("not a JSON object")
+        if "cancel" in request:
+            solving = waiting.get(request["cancel"])
+            if solving is not None:
+                solving.cancel()
+            return
+        if not isinstance(request.get("cryptogram"), str):
+            raise ValueError("no cryptogram")
+        # requests without an id can not be told apart (or cancelled), so
+        # any number of them may be waiting
+        request_id = request.get("id")
+        if request_id is not None and request_id in waiting:
+            raise ValueError(f"request {request_id!r} is already waiting")
+        request.setdefault("engine", engine)
+        if request["engine"] not in _ENGINES:
+            raise ValueError(f"unknown engine {request['engine']!r}")
+
+        solving = loop.run_in_executor(pool, solve_request, request, dictionary, cache)
+        pending.add(solving)
+        if request_id is not None:
+            waiting[request_id] = solving
+        task = asyncio.create_task(answer(request, solving))
+        answers.add(task)
+        task.add_done_callback(answers.discard)
+
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:      # longer than the limit, the rest can not be read
+                await respond({"error": "bad request: line too long"})
+                break
+            if not line:
+                break
+
+            try:
+                request = json.loads(line)
+            except ValueError as exc:
+                await respond({"error": f"bad request: {exc}"})
+                continue
+
+            request_id = request.get("id") if isinstance(request, dict) else None
+            try:
+                start(request)
+            except (ValueError, TypeError) as exc:
+                await respond({"id": request_id, "error": f"bad request: {exc}"})
+            except RuntimeError as exc:     # the worker pool broke
+                await respond({"id": request_id, "error": f"{type(exc).__name__}: {exc}"})
+
+        # the client is done sending (or can not be read), finish answering it
+        await asyncio.gather(*answers, return_exceptions=True)
+    except ConnectionError:
+        for solving in pending:
+            solving.cancel()
+    finally:
+        writer.close()
+
+
+def connect(address: str) -> socket.socket:
+    """
+    Connect to a solving server (see serve).
+
+    param address: the server's address (see parse_address)
+    return: the connected socket
+    """
+    address = parse_address(address)
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+        return sock
+    return socket.create_connection(address)
+
+
+def request_solutions(address: str, items, engine: str = "hints", timeout: float = None):
+    """
+    Generator that has a server (see serve) solve a stream of cryptograms,
+    yielding the responses in input order.  A few requests are sent ahead
+    so the server's workers stay busy.
+
+    param address: the server's address (see parse_address)
+    param items: iterable of (id, cryptogram) tuples
+    param engine: the solver engine to use (see find_best_solution)
+    param timeout: seconds each request may take (the server's default if None)
+    return: generator of response dictionaries (see serve)
+    """
+    with connect(address) as sock, sock.makefile("r", encoding="utf-8") as responses:
+        waiting = deque()
+        done = {}
+
+        def receive() -> dict:
+            while waiting[0] not in done:
+                response = json.loads(responses.readline() or '{"error": "disconnected"}')
+                if "id" not in response:
+                    raise ConnectionError(response.get("error", "bad response"))
+                done[response["id"]] = response
+            return done.pop(waiting.popleft())
+
+        for request_id, gram in items:
+            request = {"id": request_id, "cryptogram": gram, "engine": engine}
+            if timeout is not None:
+                request["timeout"] = timeout
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            waiting.append(request_id)
+            if len(waiting) >= _CLIENT_WINDOW:
+                yield receive()
+
+        while waiting:
+            yield receive()
 
 
 def main() -> int:
@@ -623,9 +4226,47 @@ def main() -> int:
 
     return: 0 upon successful run, other value for a failure.
     """
+    args = parse_args()
+    workers = args.workers or None
+
+    if args.profile:
+        enable_profiling()
+        try:
+            return _main(args, workers)
+        finally:
+            print("PROFILE:", file=sys.stderr)
+            print(disable_profiling().report(), file=sys.stderr)
+
+    return _main(args, workers)
+
+
+def _main(args: argparse.Namespace, workers: int) -> int:
+    """
+    Solve the cryptogram(s) requested on the command line.
+
+    param args: the parsed command line (see parse_args)
+    param workers: number of processes to solve with (None for one per CPU)
+    return: 0 upon successful run, other value for a failure.
+    """
+    dictionary = None
+    if args.words or args.frequencies:
+        dictionary = Dictionary(args.words, frequency_file=args.frequencies)
+    cache = SolutionCache(args.cache) if args.cache else None
+    if args.serve:
+        return serve(args.serve, workers, args.engine,
+                     args.timeout or _REQUEST_TIMEOUT, dictionary, cache)
+    if args.generate:
+        return run_generate(args.generate, args.seed, args.count, workers)
+    if args.stream:
+        return run_stream(args.stream, workers, args.engine, dictionary, cache)
+    if args.batch:
+        if args.connect:
+            return run_batch_remote(args.batch, args.connect, args.engine, args.timeout)
+        return run_batch(args.batch, workers, args.engine, dictionary, cache)
+
     # Determine the cryptogram to solve (a supplied one or a sample one)
-    if len(sys.argv) > 1:
-        solve_me = ' '.join(sys.argv[1:])
+    if args.cryptogram:
+        solve_me = ' '.join(args.cryptogram)
     else:
         solve_me = random.choice(_SAMPLE_GRAMS)
 
@@ -635,7 +4276,18 @@ def main() -> int:
     print(solve_me)
     print()
 
-    answer = find_best_solution(solve_me)
+    if args.connect:
+        try:
+            response = next(request_solutions(args.connect, [(1, solve_me)], args.engine,
+                                              args.timeout))
+        except (OSError, ValueError) as exc:
+            response = {"error": str(exc)}
+        if "error" in response:
+            print("ERROR:", response["error"], file=sys.stderr)
+            return 1
+        answer = response["solution"]
+    else:
+        answer = find_best_solution(solve_me, workers, args.engine, dictionary, cache)
     print("RESULT:")
     print("     ", end='')
     print(answer)
@@ -645,4 +4297,4 @@ def main() -> int:
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cryptogram  # noqa: E402
+
+
+WORDS = ["a", "i", "the", "cat", "dog", "sat", "on", "mat", "hello", "world",
+         "and", "ran", "to", "see", "her", "his", "was", "big", "red", "hat"]
+
+
+@pytest.fixture
+def dictionary():
+    """ a small dictionary without frequencies """
+    return cryptogram.Dictionary(words=WORDS, frequency_file="")
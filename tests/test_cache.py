@@ -0,0 +1,54 @@
+import cryptogram
+
+
+def solved(gram, dictionary):
+    return cryptogram.search_solution(gram, dictionary=dictionary)[1]
+
+
+def test_relabeled_repeat_is_found(tmp_path, dictionary):
+    cache = cryptogram.SolutionCache(str(tmp_path / "cache.db"))
+    solution = solved("Ifmmp xpsme", dictionary)
+    cache.put(solution, "search", dictionary)
+
+    # the same cryptogram with another key
+    repeat = cache.get("Uryyb jbeyq", "search", dictionary)
+    assert repeat is not None
+    assert repeat.gram == "Uryyb jbeyq"
+    assert str(repeat) == str(solution) == "Hello world"
+
+    # not for another engine, or another cryptogram
+    assert cache.get("Uryyb jbeyq", "hints", dictionary) is None
+    assert cache.get("Uryyb jbeyr", "search", dictionary) is None
+
+
+def test_least_recently_used_go(tmp_path, dictionary):
+    cache = cryptogram.SolutionCache(str(tmp_path / "cache.db"), max_entries=2)
+    grams = ["Ifmmp xpsme", "Uif dbu", "Uif eph"]
+    cache.put(solved(grams[0], dictionary), dictionary=dictionary)
+    cache.put(solved(grams[1], dictionary), dictionary=dictionary)
+    assert cache.get(grams[0], dictionary=dictionary) is not None
+
+    cache.put(solved(grams[2], dictionary), dictionary=dictionary)
+    assert len(cache) == 2
+    assert cache.get(grams[0], dictionary=dictionary) is not None
+    assert cache.get(grams[1], dictionary=dictionary) is None
+    assert cache.get(grams[2], dictionary=dictionary) is not None
+
+
+def test_other_version_misses(tmp_path, monkeypatch, dictionary):
+    cache = cryptogram.SolutionCache(str(tmp_path / "cache.db"))
+    cache.put(solved("Ifmmp xpsme", dictionary), dictionary=dictionary)
+    assert cache.get("Ifmmp xpsme", dictionary=dictionary) is not None
+
+    monkeypatch.setattr(cryptogram, "_CACHE_VERSION", cryptogram._CACHE_VERSION + 1)
+    assert cache.get("Ifmmp xpsme", dictionary=dictionary) is None
+
+
+def test_unreadable_cache_solves(tmp_path, dictionary):
+    path = tmp_path / "cache.db"
+    path.write_bytes(b"not a database" * 100)
+    cache = cryptogram.SolutionCache(str(path))
+    solution = solved("Ifmmp xpsme", dictionary)
+    cache.put(solution, dictionary=dictionary)
+    assert cache.get("Ifmmp xpsme", dictionary=dictionary) is None
+    assert len(cache) == 0
@@ -0,0 +1,50 @@
+import multiprocessing
+import pickle
+
+import pytest
+
+import cryptogram
+
+
+def test_default_dictionary_is_shared():
+    assert cryptogram.default_dictionary() is cryptogram.default_dictionary()
+
+
+def test_word_list_pickles_by_name(dictionary):
+    data = pickle.dumps(dictionary)
+    assert b"hello" not in data
+    assert pickle.loads(data) is dictionary
+
+
+def test_word_list_not_sent():
+    with pytest.raises(LookupError):
+        cryptogram._word_list_for("no such dictionary")
+
+
+def count_words(dictionary):
+    return len(dictionary.words)
+
+
+@pytest.mark.parametrize("fork", [True, False])
+def test_word_list_in_workers(monkeypatch, dictionary, fork):
+    if not fork:
+        methods = [method for method in multiprocessing.get_all_start_methods()
+                   if method != "fork"]
+        monkeypatch.setattr(multiprocessing, "get_all_start_methods", lambda: methods)
+        spawn = multiprocessing.get_context("spawn")
+        monkeypatch.setattr(multiprocessing, "get_context", lambda method=None: spawn)
+    elif "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("workers can not be forked here")
+
+    with cryptogram.process_pool(2) as pool:
+        assert list(pool.map(count_words, [dictionary] * 3)) == [len(dictionary.words)] * 3
+
+
+def test_few_ranked_words_still_tier(tmp_path):
+    frequency_file = tmp_path / "frequencies.txt"
+    frequency_file.write_text("the\ncat\n", encoding="utf-8")
+    dictionary = cryptogram.Dictionary(words=["the", "cat", "dog", "hat", "and"],
+                                       frequency_file=str(frequency_file))
+    bucket = dictionary.templates["abc"]
+    assert bucket.tiers == (2, 2, 5)
+    assert list(bucket)[:2] == ["the", "cat"]
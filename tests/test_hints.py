@@ -0,0 +1,52 @@
+import os
+import random
+
+import pytest
+
+import cryptogram
+
+
+def test_hints_from_contradictory_root():
+    # "oqj" is not in the dictionary; read as "ton" like "ouv" it solves
+    # two cipher letters to n
+    dictionary = cryptogram.Dictionary(words=["an", "to", "a", "ton", "hat"], frequency_file="")
+    gram = "e oqj ouv ou"
+    state = cryptogram.SolverState(cryptogram.cipher_words(gram), None, dictionary)
+    assert not state.propagate()
+
+    score, solution = cryptogram.find_best_solution_with_hints(
+        gram, cryptogram.build_hints(gram), dictionary=dictionary)
+    assert score == (0, 4)
+    assert str(solution) == "a ton ton to"
+
+
+@pytest.mark.parametrize("seed", [0.23379599669480722, 1, 2, 3])
+def test_anytime_ends_with_best_answer(monkeypatch, seed):
+    # with these ranks a hint ties the answer after a duplicate of it
+    # with a smaller number was seen
+    dictionary = cryptogram.Dictionary(words=["in", "it", "tan", "the", "no", "hat", "her"],
+                                       frequency_file="")
+    gram = "onc van tn vew na"
+    ranked_hints = cryptogram._ranked_hints
+
+    def shuffled_ranks(gram):
+        rng = random.Random(seed)
+        return [(rng.randrange(3), hints) for _, hints in ranked_hints(gram)]
+
+    monkeypatch.setattr(cryptogram, "_ranked_hints", shuffled_ranks)
+    *_, (score, solution) = cryptogram.solve_anytime(gram, dictionary=dictionary)
+    best = cryptogram.find_best_solution_with_hints(gram, cryptogram.build_hints(gram),
+                                                    dictionary=dictionary)
+    assert (score, str(solution)) == (best[0], str(best[1]))
+
+
+@pytest.mark.skipif(not os.path.exists(cryptogram._default_word_file()),
+                    reason="needs words_alpha.txt")
+@pytest.mark.parametrize("sample, answer", [
+    (1, "The whole problem with the world is that "),
+    (2, "Four score and seven years ago our fathers brought forth on this "),
+    (7, "The gambling known as business looks with austere disfavor upon "),
+    (11, "Any sufficiently advanced technology is indistinguishable from magic."),
+])
+def test_samples(sample, answer):
+    assert cryptogram.find_best_solution(cryptogram._SAMPLE_GRAMS[sample]).startswith(answer)
@@ -0,0 +1,62 @@
+import os
+
+import cryptogram
+
+
+def write_words(path, words):
+    path.write_text("\n".join(words) + "\n", encoding="utf-8")
+
+
+def test_index_is_reused(tmp_path):
+    word_file, index_file = tmp_path / "words.txt", tmp_path / "words.idx"
+    write_words(word_file, ["cat", "dog", "hello"])
+    built = cryptogram.load_word_index(str(word_file), str(index_file))
+    assert index_file.exists()
+
+    index = cryptogram.read_word_index(str(word_file), str(index_file))
+    assert index is not None
+    assert set(index.words) == set(built.words) == {"cat", "dog", "hello"}
+
+
+def test_touched_word_file_matches_by_hash(tmp_path):
+    word_file, index_file = tmp_path / "words.txt", tmp_path / "words.idx"
+    write_words(word_file, ["cat", "dog"])
+    cryptogram.build_word_index(str(word_file), str(index_file))
+    stat = word_file.stat()
+    os.utime(word_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cryptogram.read_word_index(str(word_file), str(index_file)) is not None
+
+
+def test_changed_word_file_rebuilds(tmp_path):
+    word_file, index_file = tmp_path / "words.txt", tmp_path / "words.idx"
+    write_words(word_file, ["cat", "dog"])
+    cryptogram.build_word_index(str(word_file), str(index_file))
+
+    write_words(word_file, ["cat", "dog", "bird"])
+    assert cryptogram.read_word_index(str(word_file), str(index_file)) is None
+    assert "bird" in cryptogram.load_word_index(str(word_file), str(index_file)).words
+    assert cryptogram.read_word_index(str(word_file), str(index_file)) is not None
+
+
+def test_other_version_rebuilds(tmp_path, monkeypatch):
+    word_file, index_file = tmp_path / "words.txt", tmp_path / "words.idx"
+    write_words(word_file, ["cat", "dog"])
+    cryptogram.build_word_index(str(word_file), str(index_file))
+
+    monkeypatch.setattr(cryptogram, "_INDEX_VERSION", cryptogram._INDEX_VERSION + 1)
+    assert cryptogram.read_word_index(str(word_file), str(index_file)) is None
+    cryptogram.load_word_index(str(word_file), str(index_file))
+    assert cryptogram.read_word_index(str(word_file), str(index_file)) is not None
+
+
+def test_damaged_index_is_not_used(tmp_path):
+    word_file, index_file = tmp_path / "words.txt", tmp_path / "words.idx"
+    write_words(word_file, ["cat", "dog"])
+    cryptogram.build_word_index(str(word_file), str(index_file))
+    data = index_file.read_bytes()
+
+    index_file.write_bytes(data[:cryptogram._INDEX_HEADER.size - 1])
+    assert cryptogram.read_word_index(str(word_file), str(index_file)) is None
+    index_file.write_bytes(b"X" + data[1:])
+    assert cryptogram.read_word_index(str(word_file), str(index_file)) is None
+    assert cryptogram.read_word_index(str(word_file), str(tmp_path / "missing.idx")) is None
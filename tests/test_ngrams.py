@@ -0,0 +1,17 @@
+import cryptogram
+
+
+def test_count_ngrams_without_numpy(monkeypatch):
+    words = ["hello", "world", "a", "it's"]
+    counts = cryptogram._count_ngrams(words)
+    monkeypatch.setattr(cryptogram, "np", None)
+    assert cryptogram._count_ngrams(words) == counts
+
+    # every n-gram of a word, with its boundaries, is counted once
+    symbols = cryptogram._ngram_symbols(["hello"])
+    code = cryptogram._ngram_code(symbols[:cryptogram._NGRAM_LENGTH])
+    assert counts[code] == 1
+
+
+def test_default_ngram_model_is_shared():
+    assert cryptogram.default_ngram_model() is cryptogram.default_ngram_model()
@@ -0,0 +1,20 @@
+import cryptogram
+
+
+def test_search_past_contradictory_root():
+    # "gje" is not in the dictionary; read as "cat" like "bje" it solves
+    # two cipher letters to t
+    dictionary = cryptogram.Dictionary(words=["i", "cat", "in", "on", "and"], frequency_file="")
+    gram = "up bje gje jpc"
+    state = cryptogram.SolverState(cryptogram.cipher_words(gram), None, dictionary)
+    assert not state.propagate()
+
+    score, solution = cryptogram.search_solution(gram, dictionary=dictionary)
+    assert score == (0, 3)
+    assert str(solution).lower().split()[1::2] == ["cat", "and"]
+
+
+def test_consistent_words_drops_conflicting_words():
+    dictionary = cryptogram.Dictionary(words=["cat", "hello"], frequency_file="")
+    assert cryptogram._consistent_words(["xyz", "xyw", "xyz"], [cryptogram._UNCONSTRAINED] * 26,
+                                        dictionary) == ["xyz", "xyz"]
@@ -0,0 +1,93 @@
+import asyncio
+import concurrent.futures
+import json
+import time
+
+import cryptogram
+
+
+def fake_solve(request, dictionary=None, cache=None):
+    """ answer after the number of seconds given as the cryptogram """
+    time.sleep(float(request["cryptogram"]))
+    return {"id": request.get("id"), "cryptogram": request["cryptogram"], "solution": "ok"}
+
+
+def exchange(lines, monkeypatch, dictionary, timeout=10.0):
+    """ send lines to an in-process server, return the responses in the order they came """
+    monkeypatch.setattr(cryptogram, "solve_request", fake_solve)
+
+    async def run():
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            def client(reader, writer):
+                return cryptogram._serve_client(reader, writer, pool, "hints", timeout,
+                                                dictionary, None)
+            server = await asyncio.start_server(client, "127.0.0.1", 0)
+            async with server:
+                reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname())
+                for line in lines:
+                    writer.write(line.encode("utf-8") + b"\n")
+                    await writer.drain()
+                    await asyncio.sleep(0.05)
+                writer.write_eof()
+                responses = [json.loads(line) async for line in reader]
+                writer.close()
+                return responses
+
+    return asyncio.run(run())
+
+
+def test_out_of_order(monkeypatch, dictionary):
+    responses = exchange([json.dumps({"id": 1, "cryptogram": "0.5"}),
+                          json.dumps({"id": 2, "cryptogram": "0"})], monkeypatch, dictionary)
+    assert [response["id"] for response in responses] == [2, 1]
+    assert all(response["solution"] == "ok" for response in responses)
+
+
+def test_cancel(monkeypatch, dictionary):
+    responses = exchange([json.dumps({"id": "slow", "cryptogram": "0.5"}),
+                          json.dumps({"cancel": "slow"}),
+                          json.dumps({"cancel": "unknown"})], monkeypatch, dictionary)
+    assert responses == [{"id": "slow", "error": "cancelled"}]
+
+
+def test_timeout(monkeypatch, dictionary):
+    responses = exchange([json.dumps({"id": 1, "cryptogram": "0.5", "timeout": 0.1})],
+                         monkeypatch, dictionary)
+    assert responses == [{"id": 1, "error": "timed out"}]
+
+
+def test_bad_lines(monkeypatch, dictionary):
+    responses = exchange(["not json", "[1, 2]", json.dumps({"id": 3}),
+                          json.dumps({"id": 4, "cryptogram": "0", "engine": "nope"}),
+                          json.dumps({"id": 5, "cryptogram": "0"})], monkeypatch, dictionary)
+    assert all(response["error"].startswith("bad request") for response in responses[:4])
+    assert [response.get("id") for response in responses] == [None, None, 3, 4, 5]
+    assert responses[-1]["solution"] == "ok"
+
+
+def test_requests_without_id(monkeypatch, dictionary):
+    responses = exchange([json.dumps({"cryptogram": "0.2"}),
+                          json.dumps({"cryptogram": "0.2"})], monkeypatch, dictionary)
+    assert [response["solution"] for response in responses] == ["ok", "ok"]
+    assert all(response["id"] is None for response in responses)
+
+
+def test_duplicate_id(monkeypatch, dictionary):
+    responses = exchange([json.dumps({"id": 7, "cryptogram": "0.3"}),
+                          json.dumps({"id": 7, "cryptogram": "0"})], monkeypatch, dictionary)
+    assert responses[0] == {"id": 7, "error": "bad request: request 7 is already waiting"}
+    assert responses[1]["solution"] == "ok"
+
+    # once answered, the id may be used again
+    responses = exchange([json.dumps({"id": 7, "cryptogram": "0"}),
+                          json.dumps({"id": 7, "cryptogram": "0"})], monkeypatch, dictionary)
+    assert [response["solution"] for response in responses] == ["ok", "ok"]
+
+
+def test_line_too_long(monkeypatch, dictionary):
+    responses = exchange([json.dumps({"id": 1, "cryptogram": "0.3"}),
+                          json.dumps({"id": 2, "cryptogram": "x" * 70000})],
+                         monkeypatch, dictionary)
+    # the request already waiting is still answered
+    assert responses == [{"error": "bad request: line too long"},
+                         {"id": 1, "cryptogram": "0.3", "solution": "ok"}]
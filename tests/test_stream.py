@@ -0,0 +1,48 @@
+import io
+import random
+import string
+
+import cryptogram
+
+PLAIN = "The cat sat on the mat.\nThe dog ran to see her hat, and the big red hat was his!\n" * 40
+
+
+def key_solution(key, dictionary):
+    """ the solution of a cryptogram made with key, every letter solved """
+    masks = [cryptogram._UNCONSTRAINED] * 26
+    for plain, cipher in zip(string.ascii_lowercase, key):
+        masks[ord(cipher) - ord('a')] = 1 << (ord(plain) - ord('a'))
+    return cryptogram.Solution("", masks, dictionary)
+
+
+def decoded(text, solution, size):
+    out = io.StringIO()
+    cryptogram.decode_stream(io.StringIO(text), out, solution, size)
+    return out.getvalue()
+
+
+def test_decode_stream_with_key(dictionary):
+    key = cryptogram.random_key(random.Random(5))
+    gram = cryptogram.encrypt(PLAIN, key)
+    solution = key_solution(key, dictionary)
+    for size in (1, 7, 4096):
+        assert decoded(gram, solution, size) == PLAIN
+
+
+def test_decode_stream_from_where_it_is(dictionary):
+    key = cryptogram.random_key(random.Random(6))
+    src = io.StringIO("header\n" + cryptogram.encrypt(PLAIN, key))
+    src.readline()
+    out = io.StringIO()
+    cryptogram.decode_stream(src, out, key_solution(key, dictionary), 100)
+    assert out.getvalue() == PLAIN
+
+
+def test_solve_and_decode_stream(dictionary):
+    gram = cryptogram.encrypt(PLAIN, cryptogram.random_key(random.Random(7)))
+    solution = cryptogram.solve_stream(io.StringIO(gram), engine="search", dictionary=dictionary)
+
+    # chunked decoding matches decoding the whole text at once
+    text = decoded(gram, solution, 13)
+    assert text == gram.translate(cryptogram.decode_table(solution))
+    assert text.lower() == PLAIN.lower()